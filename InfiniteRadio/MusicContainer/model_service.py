@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Model Service for Magenta RT
+
+Loads the Magenta RT model once and serves embed_style / generate_chunk to the
+music servers over a Unix domain socket. Restarting a music server (or running
+several of them) then reuses the warm model and GPU context instead of paying
+the full model load again.
+
+Music servers opt in by setting MAGENTA_MODEL_SOCKET to the socket path; without
+it they load the model in-process as before.
+
+Connections are pickled, so only processes holding the service's key may connect.
+The service generates a fresh key every time it starts and writes it next to the
+socket (<socket>.key); both files are readable by the service's user only.
+"""
+
+import os
+import time
+import types
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+MODEL_SOCKET_PATH = "/tmp/magenta_rt.sock"
+MODEL_SOCKET_ENV = "MAGENTA_MODEL_SOCKET"
+AUTHKEY_SIZE = 32
+
+
+def authkey_path(socket_path):
+    """Where the service publishes the key for the socket at socket_path."""
+    return socket_path + ".key"
+
+
+def read_authkey(socket_path):
+    with open(authkey_path(socket_path), "rb") as f:
+        return f.read()
+
+
+def write_authkey(socket_path):
+    """Generates a new random key and publishes it with owner-only permissions."""
+    authkey = os.urandom(AUTHKEY_SIZE)
+    path = authkey_path(socket_path)
+    tmp_path = f"{path}.{os.getpid()}"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    # Replaced atomically, so a client never reads a half-written key
+    os.replace(tmp_path, path)
+    return authkey
+
+
+def load_local_model():
+    """Loads Magenta RT in this process."""
+    from magenta_rt import system
+    return system.MagentaRT(tag="base", device="gpu", skip_cache=False, lazy=False)
+
+
+def load_model():
+    """Returns the shared model if MAGENTA_MODEL_SOCKET is set, otherwise loads it in-process."""
+    socket_path = os.environ.get(MODEL_SOCKET_ENV)
+    if not socket_path:
+        return load_local_model()
+
+    print(f"Connecting to model service at {socket_path}...")
+    while True:
+        try:
+            return RemoteMagentaRT(socket_path)
+        except (OSError, EOFError, AuthenticationError):
+            # The service is still loading the model, hasn't created the socket yet,
+            # or restarted with a new key after we read the old one
+            time.sleep(1)
+
+
+class RemoteMagentaRT:
+    """Client for ModelService exposing the parts of system.MagentaRT the music servers use.
+
+    Each thread gets its own connection, so a slow generate_chunk doesn't hold up
+    an embed_style call from the genre monitor.
+    """
+
+    def __init__(self, socket_path=MODEL_SOCKET_PATH):
+        self.socket_path = socket_path
+        self._local = threading.local()
+        info = self._connection_info()
+        self.sample_rate = info["sample_rate"]
+        self.num_channels = info["num_channels"]
+        self.config = types.SimpleNamespace(**info["config"])
+
+    def _connection_info(self):
+        # Read on every connect: the key changes whenever the service restarts
+        conn = Client(self.socket_path, family="AF_UNIX", authkey=read_authkey(self.socket_path))
+        self._local.conn = conn
+        return conn.recv()
+
+    def _call(self, method, **kwargs):
+        if getattr(self._local, "conn", None) is None:
+            self._connection_info()
+        conn = self._local.conn
+        conn.send((method, kwargs))
+        ok, result = conn.recv()
+        if not ok:
+            raise RuntimeError(f"Model service {method} failed: {result}")
+        return result
+
+    def embed_style(self, text):
+        return self._call("embed_style", text=text)
+
+    def generate_chunk(self, state=None, style=None, seed=None):
+        samples, state = self._call("generate_chunk", state=state, style=style, seed=seed)
+        return types.SimpleNamespace(samples=samples), state
+
+
+class ModelService:
+    def __init__(self, socket_path=MODEL_SOCKET_PATH):
+        self.socket_path = socket_path
+
+        print("Magenta RT Model Service")
+        print("=" * 40)
+        print("Initializing model...")
+
+        start_time = time.time()
+        self.mrt = load_local_model()
+        init_time = time.time() - start_time
+        print(f"Model loaded in {init_time:.1f} seconds")
+
+        self.info = {
+            "sample_rate": self.mrt.sample_rate,
+            "num_channels": self.mrt.num_channels,
+            "config": {
+                "crossfade_length": self.mrt.config.crossfade_length,
+                "chunk_length": self.mrt.config.chunk_length,
+            },
+        }
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        # The key goes out before the socket appears, so a client that finds the socket can read it
+        authkey = write_authkey(self.socket_path)
+        # Create the socket owner-only from the start instead of chmod-ing it afterwards
+        old_umask = os.umask(0o077)
+        try:
+            listener = Listener(self.socket_path, family="AF_UNIX", authkey=authkey)
+        finally:
+            os.umask(old_umask)
+
+        with listener:
+            print(f"Serving model on {self.socket_path}")
+            print("-" * 40)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Error accepting model client: {e}")
+                    continue
+                threading.Thread(target=self._handle_client, args=(conn,), daemon=True).start()
+
+    def _handle_client(self, conn):
+        """Answers calls from one client connection until it disconnects."""
+        try:
+            conn.send(self.info)
+            while True:
+                method, kwargs = conn.recv()
+                try:
+                    if method == "embed_style":
+                        result = self.mrt.embed_style(kwargs["text"])
+                    elif method == "generate_chunk":
+                        chunk, state = self.mrt.generate_chunk(**kwargs)
+                        result = (chunk.samples, state)
+                    else:
+                        raise ValueError(f"Unknown method '{method}'")
+                    conn.send((True, result))
+                except Exception as e:
+                    conn.send((False, repr(e)))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    service = ModelService(os.environ.get(MODEL_SOCKET_ENV, MODEL_SOCKET_PATH))
+    service.serve_forever()
@@ -3,15 +3,40 @@ import threading
 import queue
 import numpy as np
 import sounddevice as sd
-from magenta_rt import audio, system
+from numba import njit
+from model_service import load_model
 
 # Use a standard, reliable buffer size for audio streaming
 STREAM_BLOCK_SIZE = 1024
+# Print shape/peak amplitude of every DEBUG_AUDIO_STATS_EVERY-th chunk. Off by default:
+# the peak costs two extra passes over ~2 s of audio.
+DEBUG_AUDIO_STATS = False
+DEBUG_AUDIO_STATS_EVERY = 10
+# Number of STREAM_BLOCK_SIZE blocks the playback ring can hold (~4 s at 48 kHz)
+PLAYBACK_RING_SLOTS = 200
+
+@njit(cache=True, fastmath=True, boundscheck=False)
+def _apply_fade(chunk, ramp, prev, flip_ramp, out_prev):
+    """Fused fade: blends the head of chunk with prev and writes the faded tail into out_prev in one pass.
+
+    Each sample's ramp weights are loaded once and applied to every channel while the
+    row is in cache, so the ~15 KB fade region is streamed through exactly once.
+    """
+    fade_size = ramp.shape[0]
+    channels = chunk.shape[1]
+    tail = chunk.shape[0] - fade_size
+    for i in range(fade_size):
+        fade_in = ramp[i]
+        fade_out = flip_ramp[i]
+        for c in range(channels):
+            chunk[i, c] = chunk[i, c] * fade_in + prev[i, c]
+            out_prev[i, c] = chunk[tail + i, c] * fade_out
 
 class AudioFade:
     """Handles the cross fade between audio chunks.
     
-    This is the same class used in the official magenta-realtime demo.
+    Adapted from the class used in the official magenta-realtime demo, with the
+    multiply/add/store passes fused into a single numba kernel.
     """
     
     def __init__(self, chunk_size: int, num_chunks: int, stereo: bool):
@@ -19,29 +44,73 @@ class AudioFade:
         self.fade_size = fade_size
         self.num_chunks = num_chunks
         
-        self.previous_chunk = np.zeros(fade_size)
-        self.ramp = np.sin(np.linspace(0, np.pi / 2, fade_size)) ** 2
+        self.ramp = (np.sin(np.linspace(0, np.pi / 2, fade_size)) ** 2).astype(np.float32)
+        self.flip_ramp = self.ramp[::-1].copy()
         
-        if stereo:
-            self.previous_chunk = self.previous_chunk[:, np.newaxis]
-            self.ramp = self.ramp[:, np.newaxis]
+        self.previous_chunk = np.zeros((fade_size, 2 if stereo else 1), dtype=np.float32)
+        self._next_previous = np.empty_like(self.previous_chunk)
     
     def reset(self):
-        self.previous_chunk = np.zeros_like(self.previous_chunk)
+        self.previous_chunk.fill(0)
     
     def __call__(self, chunk: np.ndarray) -> np.ndarray:
-        chunk[: self.fade_size] *= self.ramp
-        chunk[: self.fade_size] += self.previous_chunk
-        self.previous_chunk = chunk[-self.fade_size :] * np.flip(self.ramp)
+        samples = chunk if chunk.ndim == 2 else chunk[:, np.newaxis]
+        _apply_fade(samples, self.ramp, self.previous_chunk, self.flip_ramp, self._next_previous)
+        # Swap the two preallocated buffers rather than copying the new tail back
+        self.previous_chunk, self._next_previous = self._next_previous, self.previous_chunk
         return chunk[: -self.fade_size]
 
+class PlaybackRing:
+    """Lock-free single-producer/single-consumer ring of STREAM_BLOCK_SIZE audio blocks.
+
+    The generator thread only ever advances head and the audio callback only ever
+    advances tail, so neither side takes a lock. Rebinding an int attribute is atomic
+    under the GIL, and a slot is published by bumping head only after it is filled.
+    """
+
+    def __init__(self, num_slots: int, channels: int):
+        self.slots = np.zeros((num_slots, STREAM_BLOCK_SIZE, channels), dtype=np.float32)
+        self.num_slots = num_slots
+        self.head = 0  # Written by the producer only
+        self.tail = 0  # Written by the consumer only
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, block: np.ndarray) -> bool:
+        """Copies one float32 block into the next free slot. Returns False if the ring is full."""
+        head = self.head
+        if head - self.tail >= self.num_slots:
+            return False
+        np.copyto(self.slots[head % self.num_slots], block, casting='no')
+        self.head = head + 1
+        return True
+
+    def pop_into(self, out: np.ndarray) -> bool:
+        """Copies the oldest block into out, which must be float32. Returns False if the ring is empty."""
+        tail = self.tail
+        if self.head == tail:
+            return False
+        np.copyto(out, self.slots[tail % self.num_slots], casting='no')
+        self.tail = tail + 1
+        return True
+
+    def clear(self):
+        """Discards everything buffered. Only call this from the consumer side."""
+        self.tail = self.head
+
 class ContinuousMusicPlayer:
     def __init__(self, style="synthwave", buffer_size=8):
         self.style = style
-        # Queue for processed audio buffers ready for playback
-        self.playback_queue = queue.Queue(maxsize=200)
+        # Ring of processed audio buffers ready for playback (allocated once the channel count is known)
+        self.playback_queue = None
+        
+        # Raw model output handed from the generator thread to the processor thread. Two slots
+        # let the model start on chunk N+1 while chunk N is still being faded and split.
+        self.raw_chunk_queue = queue.Queue(maxsize=2)
         
         self.generator_thread = None
+        self.processor_thread = None
         self.stream = None
         self.stop_event = threading.Event()
 
@@ -50,16 +119,14 @@ class ContinuousMusicPlayer:
         print(f"Initializing model...")
         
         start_time = time.time()
-        self.mrt = system.MagentaRT(
-            tag="base",
-            device="gpu",
-            skip_cache=False,
-            lazy=False
-        )
+        self.mrt = load_model()
         init_time = time.time() - start_time
         print(f"Model loaded in {init_time:.1f} seconds")
         
         self.sample_rate = self.mrt.sample_rate
+        self.playback_queue = PlaybackRing(PLAYBACK_RING_SLOTS, self.mrt.num_channels)
+        # Samples left over after the last full buffer of a chunk, played at the start of the next one
+        self._carry = np.empty((0, self.mrt.num_channels), dtype=np.float32)
         print(f"Embedding style: '{self.style}'...")
         self.style_embedding = self.mrt.embed_style(self.style)
         
@@ -76,9 +143,9 @@ class ContinuousMusicPlayer:
         print(f"Stream block size: {STREAM_BLOCK_SIZE} frames")
         print("-" * 40)
 
-    def _generate_and_process_chunks(self):
-        """Single thread that generates chunks and processes them with AudioFade."""
-        print("Starting chunk generation and processing thread...")
+    def _generate_chunks(self):
+        """Generator thread: only runs the model, so the GPU never waits on post-processing."""
+        print("Starting chunk generation thread...")
         chunk_count = 0
         
         while not self.stop_event.is_set():
@@ -92,61 +159,104 @@ class ContinuousMusicPlayer:
                     seed=chunk_count
                 )
                 
-                print(f"Generated chunk {chunk_count}, shape: {chunk.samples.shape}")
+                while not self.stop_event.is_set():
+                    try:
+                        self.raw_chunk_queue.put(chunk.samples, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
                 
+            except Exception as e:
+                print(f"   ERROR in generator thread: {e}")
+                import traceback
+                traceback.print_exc()
+                self.stop_event.set()
+                break
+                
+        print("Chunk generation thread stopped.")
+
+    def _process_chunks(self):
+        """Processor thread: applies AudioFade to raw chunks and splits them into playback buffers."""
+        print("Starting chunk processing thread...")
+        chunk_count = 0
+        
+        while not self.stop_event.is_set():
+            try:
+                samples = self.raw_chunk_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            try:
+                # Everything downstream (fade kernel, playback ring, audio callback) works in
+                # C-contiguous float32, so convert here once rather than on the audio thread
+                samples = np.ascontiguousarray(samples, dtype=np.float32)
                 # Apply AudioFade for seamless crossfading
                 # chunk.samples is in (samples, channels) format
-                faded_audio = self.fade(chunk.samples)
+                faded_audio = self.fade(samples)
                 
-                print(f"Faded audio shape: {faded_audio.shape}, max amplitude: {np.abs(faded_audio).max():.3f}")
+                chunk_count += 1
+                if DEBUG_AUDIO_STATS and chunk_count % DEBUG_AUDIO_STATS_EVERY == 0:
+                    print(f"Chunk {chunk_count}: faded audio shape: {faded_audio.shape}, max amplitude: {np.abs(faded_audio).max():.3f}")
                 
                 # Split into small buffers for streaming
                 self._split_into_buffers(faded_audio)
                 
             except Exception as e:
-                print(f"   ERROR in generator/processor thread: {e}")
+                print(f"   ERROR in processor thread: {e}")
                 import traceback
                 traceback.print_exc()
                 self.stop_event.set()
                 break
                 
-        print("Chunk generation and processing thread stopped.")
+        print("Chunk processing thread stopped.")
 
     def _split_into_buffers(self, audio_data):
-        """Split large audio chunk into small fixed-size buffers."""
+        """Split large audio chunk into small fixed-size buffers.
+
+        A partial buffer at the end is carried over and completed by the next chunk
+        instead of being padded with silence.
+        """
+        if len(self._carry):
+            needed = STREAM_BLOCK_SIZE - len(self._carry)
+            if audio_data.shape[0] < needed:
+                self._carry = np.concatenate((self._carry, audio_data))
+                return
+            buffer = np.concatenate((self._carry, audio_data[:needed]))
+            self._carry = self._carry[:0]
+            if not self._push_buffer(buffer):
+                return
+            audio_data = audio_data[needed:]
+
         num_samples = audio_data.shape[0]
+        full_samples = num_samples - num_samples % STREAM_BLOCK_SIZE
         
-        for i in range(0, num_samples, STREAM_BLOCK_SIZE):
+        for i in range(0, full_samples, STREAM_BLOCK_SIZE):
             if self.stop_event.is_set():
-                break
-                
-            end_idx = min(i + STREAM_BLOCK_SIZE, num_samples)
-            buffer = audio_data[i:end_idx]
-            
-            # Pad the last buffer if necessary
-            if buffer.shape[0] < STREAM_BLOCK_SIZE:
-                padding_needed = STREAM_BLOCK_SIZE - buffer.shape[0]
-                padding = np.zeros((padding_needed, buffer.shape[1]), dtype=np.float32)
-                buffer = np.vstack([buffer, padding])
-            
-            try:
-                self.playback_queue.put(buffer, timeout=1)
-            except queue.Full:
+                return
+            if not self._push_buffer(audio_data[i:i + STREAM_BLOCK_SIZE]):
+                return
+
+        self._carry = audio_data[full_samples:].copy()
+
+    def _push_buffer(self, buffer):
+        """Waits up to a second for the callback to free a slot. Returns False if the buffer was dropped."""
+        deadline = time.monotonic() + 1
+        while not self.playback_queue.push(buffer):
+            if self.stop_event.is_set():
+                return False
+            if time.monotonic() >= deadline:
                 # This should be rare with proper buffering
                 print("   WARNING: Playback buffer full")
-                break
+                return False
+            time.sleep(0.005)
+        return True
 
     def _audio_callback(self, outdata, frames, time, status):
         """Sounddevice callback: Plays the processed audio buffers."""
         if status:
             print(f"Audio callback status: {status}", flush=True)
 
-        assert frames == STREAM_BLOCK_SIZE, f"Expected {STREAM_BLOCK_SIZE} frames, got {frames}"
-
-        try:
-            buffer = self.playback_queue.get_nowait()
-            outdata[:] = buffer
-        except queue.Empty:
+        if not self.playback_queue.pop_into(outdata):
             print("   WARNING: Playback buffer underrun! Playing silence.", flush=True)
             outdata.fill(0)
 
@@ -154,10 +264,13 @@ class ContinuousMusicPlayer:
         """Starts the generator thread and audio stream."""
         self.stop_event.clear()
         
-        # Start single background thread for generation and processing
-        self.generator_thread = threading.Thread(target=self._generate_and_process_chunks)
+        # Start the background generation and processing threads
+        self.generator_thread = threading.Thread(target=self._generate_chunks)
         self.generator_thread.daemon = True
         self.generator_thread.start()
+        self.processor_thread = threading.Thread(target=self._process_chunks)
+        self.processor_thread.daemon = True
+        self.processor_thread.start()
         
         # Pre-fill the playback buffer
         print("Pre-filling playback buffer...")
@@ -166,11 +279,11 @@ class ContinuousMusicPlayer:
         timeout_counter = 0
         max_timeout = 300  # 30 seconds max wait
         
-        while self.playback_queue.qsize() < target_buffer_size and timeout_counter < max_timeout:
+        while len(self.playback_queue) < target_buffer_size and timeout_counter < max_timeout:
             if self.stop_event.is_set():
                 print("Thread died during pre-fill. Exiting.")
                 return
-            if not self.generator_thread.is_alive():
+            if not self.generator_thread.is_alive() or not self.processor_thread.is_alive():
                 print("Generator thread died during pre-fill. Exiting.")
                 return
             time.sleep(0.1)
@@ -178,9 +291,9 @@ class ContinuousMusicPlayer:
             
             # Print progress every 5 seconds
             if timeout_counter % 50 == 0:
-                print(f"Buffer status: {self.playback_queue.qsize()}/{target_buffer_size} buffers ready...")
+                print(f"Buffer status: {len(self.playback_queue)}/{target_buffer_size} buffers ready...")
             
-        current_buffer_size = self.playback_queue.qsize()
+        current_buffer_size = len(self.playback_queue)
         if current_buffer_size < target_buffer_size:
             print(f"WARNING: Only {current_buffer_size} buffers ready, but proceeding anyway...")
         else:
@@ -195,6 +308,9 @@ class ContinuousMusicPlayer:
                 callback=self._audio_callback,
                 dtype='float32'
             )
+            # Checked once here so the callback can copy blocks straight into outdata
+            assert self.stream.blocksize == STREAM_BLOCK_SIZE, f"Expected {STREAM_BLOCK_SIZE} frames, got {self.stream.blocksize}"
+            assert self.stream.dtype == 'float32', f"Expected float32 output, got {self.stream.dtype}"
             self.stream.start()
             
             print(f"\n🎵 Music is playing seamlessly! 🎵")
@@ -205,7 +321,7 @@ class ContinuousMusicPlayer:
             while not self.stop_event.is_set():
                 time.sleep(2)
                 # Optional: print buffer status if low
-                buffer_count = self.playback_queue.qsize()
+                buffer_count = len(self.playback_queue)
                 if buffer_count < 5:
                     print(f"   Buffer low: {buffer_count} buffers remaining")
 
@@ -230,17 +346,17 @@ class ContinuousMusicPlayer:
             self.stream.close()
             print("Audio stream stopped.")
 
-        # Clear queue to unblock thread
-        try:
-            while not self.playback_queue.empty():
-                self.playback_queue.get_nowait()
-        except:
-            pass
+        # Clear the ring to unblock the generator thread
+        if self.playback_queue is not None:
+            self.playback_queue.clear()
 
-        # Wait for thread to finish
+        # Wait for threads to finish
         if self.generator_thread and self.generator_thread.is_alive():
             self.generator_thread.join(timeout=3)
             print("Generator thread stopped.")
+        if self.processor_thread and self.processor_thread.is_alive():
+            self.processor_thread.join(timeout=3)
+            print("Processor thread stopped.")
         
         print("Music player stopped.")
 
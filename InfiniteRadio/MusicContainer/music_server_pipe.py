@@ -1,34 +1,147 @@
 import time
 import threading
 import queue
+import collections
 import numpy as np
 import os
-from magenta_rt import system
+import select
+from numba import njit
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # Not on Linux or not installed; the genre monitor falls back to polling
+    INotify = None
+from model_service import load_model
 
 # The frame size must match the Go server!
 # 48000 Hz * 0.020 s = 960 samples per frame
 PIPE_FRAME_SIZE = 960
+# Frames coalesced into each pipe write (4 * 20 ms = 80 ms) to cut syscalls per second
+PIPE_FRAMES_PER_WRITE = 4
+# Longest the writer waits on a stalled reader before dropping a batch instead of blocking
+PIPE_STALL_TIMEOUT_MS = 100
+
+# Genres the DJs commonly request; their style embeddings are computed in the background at startup
+PREFETCH_GENRES = [
+    "lofi hip hop", "synthwave", "chillwave", "upbeat pop", "chiptune", "jazz", "ambient",
+    "cinematic", "minimal techno", "dark electronic", "cyberpunk", "progressive rock",
+    "epic orchestral", "acoustic folk", "corporate smooth jazz",
+]
+
+# How many model chunks the pipe writer's ring buffer can hold before it has to grow
+RING_CAPACITY_CHUNKS = 4
+
+@njit(cache=True, fastmath=True, boundscheck=False)
+def _apply_fade(chunk, ramp, prev, flip_ramp, out_prev):
+    """Fused fade: blends the head of chunk with prev and writes the faded tail into out_prev in one pass.
+
+    Each sample's ramp weights are loaded once and applied to every channel while the
+    row is in cache, so the ~15 KB fade region is streamed through exactly once.
+    """
+    fade_size = ramp.shape[0]
+    channels = chunk.shape[1]
+    tail = chunk.shape[0] - fade_size
+    for i in range(fade_size):
+        fade_in = ramp[i]
+        fade_out = flip_ramp[i]
+        for c in range(channels):
+            chunk[i, c] = chunk[i, c] * fade_in + prev[i, c]
+            out_prev[i, c] = chunk[tail + i, c] * fade_out
+
+@njit(cache=True, fastmath=True)
+def _float_to_int16(samples, out):
+    """Clips to [-1, 1], scales and casts to int16 in a single pass, writing into out."""
+    for i in range(samples.shape[0]):
+        for c in range(samples.shape[1]):
+            x = samples[i, c]
+            if x > 1.0:
+                x = 1.0
+            elif x < -1.0:
+                x = -1.0
+            out[i, c] = np.int16(x * 32767)
+
+@njit(cache=True, fastmath=True)
+def _mix_to_int16(old, new, fade_out_volume, fade_in_volume, out):
+    """Crossfades old into new, then clips, scales and casts to int16 in a single pass."""
+    for i in range(new.shape[0]):
+        for c in range(new.shape[1]):
+            x = old[i, c] * fade_out_volume + new[i, c] * fade_in_volume
+            if x > 1.0:
+                x = 1.0
+            elif x < -1.0:
+                x = -1.0
+            out[i, c] = np.int16(x * 32767)
 
 class AudioFade:
     """Handles the short, intra-chunk crossfade from Magenta's model."""
     def __init__(self, chunk_size: int, num_chunks: int, stereo: bool):
         fade_size = chunk_size * num_chunks
         self.fade_size = fade_size
-        self.previous_chunk = np.zeros(fade_size)
-        self.ramp = np.sin(np.linspace(0, np.pi / 2, fade_size)) ** 2
-        if stereo:
-            self.previous_chunk = self.previous_chunk[:, np.newaxis]
-            self.ramp = self.ramp[:, np.newaxis]
+        self.ramp = (np.sin(np.linspace(0, np.pi / 2, fade_size)) ** 2).astype(np.float32)
+        self.flip_ramp = self.ramp[::-1].copy()
+        self.previous_chunk = np.zeros((fade_size, 2 if stereo else 1), dtype=np.float32)
+        self._next_previous = np.empty_like(self.previous_chunk)
     
     def reset(self):
-        self.previous_chunk = np.zeros_like(self.previous_chunk)
+        self.previous_chunk.fill(0)
     
     def __call__(self, chunk: np.ndarray) -> np.ndarray:
-        chunk[: self.fade_size] *= self.ramp
-        chunk[: self.fade_size] += self.previous_chunk
-        self.previous_chunk = chunk[-self.fade_size :] * np.flip(self.ramp)
+        samples = chunk if chunk.ndim == 2 else chunk[:, np.newaxis]
+        _apply_fade(samples, self.ramp, self.previous_chunk, self.flip_ramp, self._next_previous)
+        # Swap the two preallocated buffers rather than copying the new tail back
+        self.previous_chunk, self._next_previous = self._next_previous, self.previous_chunk
         return chunk[: -self.fade_size]
 
+class AudioRingBuffer:
+    """Preallocated FIFO of (samples, channels) audio, so frames can be consumed without re-stacking."""
+    def __init__(self, capacity: int, channels: int, dtype=np.float32):
+        self.buffer = np.zeros((capacity, channels), dtype=dtype)
+        self.capacity = capacity
+        self.read_pos = 0
+        self.write_pos = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def write(self, samples: np.ndarray):
+        """Copies samples in at write_pos, wrapping around the end of the buffer if needed."""
+        num_samples = len(samples)
+        if num_samples > self.capacity - self.count:
+            self._grow(self.count + num_samples)
+
+        first = min(num_samples, self.capacity - self.write_pos)
+        np.copyto(self.buffer[self.write_pos:self.write_pos + first], samples[:first])
+        if first < num_samples:
+            np.copyto(self.buffer[:num_samples - first], samples[first:])
+        self.write_pos = (self.write_pos + num_samples) % self.capacity
+        self.count += num_samples
+
+    def read(self, num_samples: int) -> np.ndarray:
+        """Consumes num_samples. Returns a view unless the read crosses the wrap boundary.
+
+        The view is only valid until the next write(), so use it before buffering more audio.
+        """
+        end = self.read_pos + num_samples
+        if end <= self.capacity:
+            samples = self.buffer[self.read_pos:end]
+        else:
+            samples = np.concatenate((self.buffer[self.read_pos:], self.buffer[:end - self.capacity]))
+        self.read_pos = end % self.capacity
+        self.count -= num_samples
+        return samples
+
+    def _grow(self, min_capacity: int):
+        # Only happens if a chunk is larger than expected; keeps the buffered samples in order
+        new_capacity = max(min_capacity, self.capacity * 2)
+        count = self.count
+        new_buffer = np.zeros((new_capacity, self.buffer.shape[1]), dtype=self.buffer.dtype)
+        new_buffer[:count] = self.read(count)
+        self.buffer = new_buffer
+        self.capacity = new_capacity
+        self.read_pos = 0
+        self.write_pos = count
+        self.count = count
+
 class ContinuousMusicPipeWriter:
     def __init__(self, style="lofi hip hop", pipe_path="/tmp/audio_pipe"):
         self.style = style
@@ -36,41 +149,79 @@ class ContinuousMusicPipeWriter:
         self.genre_file_path = "/tmp/genre_request.txt"
         
         # --- State Machine and Buffers ---
-        self.buffer_lock = threading.Lock()
+        # Only the pipe writer thread touches the audio buffers and the transition state.
+        # The genre monitor just bumps _transition_requests; the writer notices the change
+        # before its next frame and starts the crossfade itself, so neither side takes a lock.
+        # Every chunk is tagged with the transition number of the style it was generated with,
+        # so old-genre chunks still in flight through the pipeline feed the fade-out and the
+        # crossfade itself only starts at the first chunk of the new genre.
         self.transition_state = 'NORMAL'  # Can be 'NORMAL' or 'TRANSITIONING'
+        self._transition_requests = 0  # Written by the genre monitor only
+        self._transitions_started = 0  # Written by the pipe writer only; the tag of the genre now playing
         self.transition_duration = 8.0  # seconds
-        self.transition_start_time = 0
-        self.fade_out_buffer = np.array([], dtype=np.int16) # Holds old genre for fading
+        self.transition_frame_index = 0  # Frames written since the transition started
+        # Old genre audio for the fade, kept as the chunks it arrived in and consumed as slice views
+        self.fade_out_buffers = collections.deque()
         
         # --- Queues and Threads ---
-        self.generation_queue = queue.Queue(maxsize=5)
+        # Kept small so at most a few model chunks of latency can build up behind the pipe
+        self.generation_queue = queue.Queue(maxsize=3)
+        self.generation_overruns = 0  # Chunks dropped because the pipe reader fell behind
+        # Raw model output handed from the GPU thread to the post-processing thread. Two slots
+        # let the model start on chunk N+1 while chunk N is still being faded.
+        self.raw_chunk_queue = queue.Queue(maxsize=2)
         self.generator_thread = None
+        self.post_process_thread = None
         self.pipe_writer_thread = None
         self.genre_monitor_thread = None
+        self.embedding_prefetch_thread = None
         self.stop_event = threading.Event()
         self.pipe_handle = None
+        self.pipe_overruns = 0  # Batches dropped because the pipe reader stalled
         self.current_genre = style
         self.last_genre_check = 0
 
         # --- Internal Buffers and Model ---
-        self.buffered_audio = np.array([], dtype=np.int16)
+        # Audio stays float32 until it is written to the pipe, where it is encoded to int16 once
+        self.buffered_audio = None  # AudioRingBuffer, allocated once the model's chunk size is known
 
         print("Magenta RT Continuous Music Pipe Writer")
         print("=" * 40)
         print("Initializing model...")
         
         start_time = time.time()
-        self.mrt = system.MagentaRT(tag="base", device="gpu", skip_cache=False, lazy=False)
+        self.mrt = load_model()
         init_time = time.time() - start_time
         print(f"Model loaded in {init_time:.1f} seconds")
         
         self.sample_rate = self.mrt.sample_rate
         self.channels = self.mrt.num_channels
-        self.buffered_audio = self.buffered_audio.reshape(0, self.channels)
-        self.fade_out_buffer = self.fade_out_buffer.reshape(0, self.channels)
+        chunk_samples = int(self.mrt.config.chunk_length * self.sample_rate)
+        self.buffered_audio = AudioRingBuffer(chunk_samples * RING_CAPACITY_CHUNKS, self.channels)
+        self._silent_frame = np.zeros((PIPE_FRAME_SIZE, self.channels), dtype=np.float32)
+        # Every batch of frames is encoded into this one buffer and written straight from its memory,
+        # so the pipe path allocates neither an int16 array nor a bytes copy per write
+        self._pipe_scratch = np.empty((PIPE_FRAMES_PER_WRITE * PIPE_FRAME_SIZE, self.channels), dtype=np.int16)
+        self._pipe_scratch_bytes = memoryview(self._pipe_scratch).cast('B')
+        self._pipe_frames = self._pipe_scratch.reshape(PIPE_FRAMES_PER_WRITE, PIPE_FRAME_SIZE, self.channels)
+        self._pipe_frame_bytes = PIPE_FRAME_SIZE * self.channels * self._pipe_scratch.itemsize
+
+        # The crossfade advances one step per pipe frame, so its smoothstep curve is
+        # computed once here and indexed by frame number during the transition.
+        self.transition_frames = int(self.transition_duration * self.sample_rate / PIPE_FRAME_SIZE)
+        progress = np.linspace(0.0, 1.0, self.transition_frames)
+        self._fade_in_curve = (progress * progress * (3.0 - 2.0 * progress)).astype(np.float32)  # smoothstep
+        self._fade_out_curve = 1.0 - self._fade_in_curve
         
         print(f"Embedding style: '{self.style}'...")
-        self.style_embedding = self.mrt.embed_style(self.style)
+        style_embedding = self.mrt.embed_style(self.style)
+        # Double-buffered style: the monitor fills the inactive slot, then flips _active_style
+        # to (slot, transition number). Rebinding the tuple is atomic under the GIL, so the
+        # generator reads the slot and the tag for its chunk together without a lock.
+        self._style_slots = [style_embedding, style_embedding]
+        self._active_style = (0, 0)
+        # Style embeddings by genre text, so a genre change doesn't have to wait on embed_style
+        self._embedding_cache = {self.style: style_embedding}
         
         chunk_size = int(self.mrt.config.crossfade_length * self.sample_rate)
         self.fade = AudioFade(chunk_size=chunk_size, num_chunks=1, stereo=(self.channels==2))
@@ -79,95 +230,175 @@ class ContinuousMusicPipeWriter:
         print("-" * 40)
 
     def _monitor_genre_changes(self):
-        """Monitors for genre changes and triggers the transition state."""
+        """Monitors for genre changes and triggers the transition state.
+
+        Sleeps on inotify until the genre file is written; polls every 0.5 s where inotify isn't available.
+        """
         print("Starting genre monitor thread...")
+        inotify = None
+        if INotify is not None:
+            try:
+                inotify = INotify()
+                inotify.add_watch(os.path.dirname(self.genre_file_path), inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+            except OSError as e:
+                print(f"   inotify unavailable ({e}), polling the genre file instead")
+                inotify = None
+        genre_file_name = os.path.basename(self.genre_file_path)
+
+        check_file = True
         while not self.stop_event.is_set():
             try:
-                if os.path.exists(self.genre_file_path):
-                    file_mod_time = os.path.getmtime(self.genre_file_path)
-                    if file_mod_time > self.last_genre_check:
-                        with open(self.genre_file_path, 'r') as f:
-                            content = f.read().strip()
-                        
-                        new_genre = content.split(":")[-1] # Gets genre from "SMOOTH:genre" or "genre"
-                        
-                        if new_genre and new_genre != self.current_genre:
-                            print(f"Genre change detected: '{self.current_genre}' -> '{new_genre}'")
-                            
-                            try:
-                                new_embedding = self.mrt.embed_style(new_genre)
-                                print("   New style embedded. Triggering crossfade transition.")
-                                
-                                # --- THIS IS THE CRITICAL TRANSITION TRIGGER ---
-                                with self.buffer_lock:
-                                    # 1. Update generator to produce the new genre immediately
-                                    self.style_embedding = new_embedding
-                                    self.current_genre = new_genre
-                                    self.fade.reset() # Reset intra-chunk fade for the new genre
-
-                                    # 2. Collect all buffered audio from the OLD genre
-                                    # Start with the partially-used chunk in the main buffer
-                                    old_audio_chunks = [self.buffered_audio]
-                                    # Then, drain the queue and APPEND each chunk to our list
-                                    while not self.generation_queue.empty():
-                                        try:
-                                            old_audio_chunks.append(self.generation_queue.get_nowait())
-                                        except queue.Empty:
-                                            break
-                                    
-                                    # 3. Store the combined audio in the dedicated fade_out_buffer
-                                    # np.vstack correctly stacks the arrays of shape (n_samples, channels)
-                                    self.fade_out_buffer = np.vstack(old_audio_chunks)
-                                    # Clear the main buffer so it can start filling with the NEW genre's audio
-                                    self.buffered_audio = np.array([], dtype=np.int16).reshape(0, self.channels)
-                                    
-                                    # 4. Set the state machine to begin the crossfade
-                                    self.transition_state = 'TRANSITIONING'
-                                    self.transition_start_time = time.time()
-                                    # --- END OF CORRECTED LOGIC ---
-                                
-                            except Exception as e:
-                                print(f"   Error embedding style '{new_genre}': {e}")
-                        
-                        self.last_genre_check = file_mod_time
-                time.sleep(0.5)
+                if check_file:
+                    self._check_genre_file()
+                if inotify is not None:
+                    # The timeout only bounds how long stop_event can go unnoticed
+                    events = inotify.read(timeout=1000)
+                    check_file = any(event.name == genre_file_name for event in events)
+                else:
+                    time.sleep(0.5)
             except Exception as e:
                 print(f"Error in genre monitor thread: {e}")
                 time.sleep(1)
+        if inotify is not None:
+            inotify.close()
         print("Genre monitor thread stopped.")
 
+    def _check_genre_file(self):
+        """Reads the genre file if it changed and triggers the transition for a new genre."""
+        if os.path.exists(self.genre_file_path):
+            file_mod_time = os.path.getmtime(self.genre_file_path)
+            if file_mod_time > self.last_genre_check:
+                with open(self.genre_file_path, 'r') as f:
+                    content = f.read().strip()
+                
+                new_genre = content.split(":")[-1] # Gets genre from "SMOOTH:genre" or "genre"
+                
+                if new_genre and new_genre != self.current_genre:
+                    print(f"Genre change detected: '{self.current_genre}' -> '{new_genre}'")
+                    
+                    try:
+                        new_embedding = self._embedding_cache.get(new_genre)
+                        if new_embedding is None:
+                            new_embedding = self.mrt.embed_style(new_genre)
+                            self._embedding_cache[new_genre] = new_embedding
+                            print("   New style embedded. Triggering crossfade transition.")
+                        else:
+                            print("   Using prefetched style. Triggering crossfade transition.")
+                        
+                        # --- THIS IS THE CRITICAL TRANSITION TRIGGER ---
+                        # 1. Update generator to produce the new genre immediately
+                        request = self._transition_requests + 1
+                        inactive = (self._active_style[0] + 1) & 1
+                        self._style_slots[inactive] = new_embedding
+                        self._active_style = (inactive, request)
+                        self.current_genre = new_genre
+
+                        # 2. Ask the pipe writer to move the OLD genre's audio into the fade-out buffer
+                        self._transition_requests = request
+                        
+                    except Exception as e:
+                        print(f"   Error embedding style '{new_genre}': {e}")
+                
+                self.last_genre_check = file_mod_time
+
+    def _prefetch_embeddings(self):
+        """Embeds PREFETCH_GENRES in the background so common genre changes are a cache hit."""
+        print("Starting style embedding prefetch thread...")
+        for genre in PREFETCH_GENRES:
+            if self.stop_event.is_set():
+                break
+            if genre in self._embedding_cache:
+                continue
+            try:
+                self._embedding_cache[genre] = self.mrt.embed_style(genre)
+            except Exception as e:
+                print(f"   Error prefetching style '{genre}': {e}")
+        print(f"Style embedding prefetch finished ({len(self._embedding_cache)} cached).")
+
+    def _queue_chunk(self, audio):
+        """Queues a (tag, audio) chunk, dropping the oldest queued chunk if the reader has stalled.
+
+        A full queue normally just means we are ahead of real time, so wait for a slot first.
+        Only when none frees up do we discard old audio, keeping latency bounded.
+        """
+        try:
+            self.generation_queue.put(audio, timeout=5)
+            return
+        except queue.Full:
+            pass
+        try:
+            self.generation_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.generation_queue.put_nowait(audio)
+        self.generation_overruns += 1
+        if self.generation_overruns % 10 == 1:
+            print(f"WARNING: Pipe reader is behind, dropped {self.generation_overruns} old chunk(s) so far")
+
     def _generation_loop(self):
-        """Generates audio based on the current self.style_embedding. Blissfully unaware of transitions."""
+        """Generates audio based on the active style slot. Blissfully unaware of transitions.
+
+        Only runs the model; fading happens on the post-processing thread so the GPU never waits on it.
+        """
         print("Starting audio generation thread...")
         chunk_count = 0
         while not self.stop_event.is_set():
             try:
                 chunk_count += 1
                 
-                # The monitor thread changes self.style_embedding, the generator just uses it
+                # The monitor thread flips the active style slot, the generator just uses it
+                slot, tag = self._active_style
                 chunk, self.generation_state = self.mrt.generate_chunk(
                     state=self.generation_state,
-                    style=self.style_embedding,
+                    style=self._style_slots[slot],
                     seed=chunk_count
                 )
-                faded_audio = self.fade(chunk.samples)
-                audio_int16 = (np.clip(faded_audio, -1.0, 1.0) * 32767).astype(np.int16)
-                
-                self.generation_queue.put(audio_int16, timeout=5)
-            except queue.Full:
-                time.sleep(0.5)
-                continue
+                while not self.stop_event.is_set():
+                    try:
+                        self.raw_chunk_queue.put((tag, chunk.samples), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
             except Exception as e:
                 print(f"ERROR in generator thread: {e}")
                 self.stop_event.set()
                 break
         print("Audio generation thread stopped.")
 
+    def _post_process_loop(self):
+        """Fades raw chunks from the generator and queues them for the pipe writer."""
+        print("Starting audio post-processing thread...")
+        last_tag = 0
+        while not self.stop_event.is_set():
+            try:
+                tag, samples = self.raw_chunk_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if tag != last_tag:
+                    # First chunk of a new genre: don't blend it with the old genre's tail.
+                    # Reset here, on the only thread that applies the fade.
+                    self.fade.reset()
+                    last_tag = tag
+                faded_audio = self.fade(samples)
+                
+                # Queued as float32; the pipe writer clips and encodes to int16 at write time
+                self._queue_chunk((tag, faded_audio.reshape(len(faded_audio), -1)))
+            except Exception as e:
+                print(f"ERROR in post-processing thread: {e}")
+                self.stop_event.set()
+                break
+        print("Audio post-processing thread stopped.")
+
     def _pipe_writer_loop(self):
         """Writes to the pipe, handling 'NORMAL' and 'TRANSITIONING' states."""
         print("Starting pipe writer thread...")
         try:
+            # Opening blocks until the reader connects; after that every write is non-blocking
             self.pipe_handle = os.open(self.pipe_path, os.O_WRONLY)
+            os.set_blocking(self.pipe_handle, False)
+            self._pipe_poll = select.poll()
+            self._pipe_poll.register(self.pipe_handle, select.POLLOUT)
             print("Pipe opened by a reader. Starting to write frames.")
         except Exception as e:
             print(f"FATAL: Could not open pipe: {e}")
@@ -175,15 +406,24 @@ class ContinuousMusicPipeWriter:
             return
 
         while not self.stop_event.is_set():
-            frame_to_send = None
-            if self.transition_state == 'TRANSITIONING':
-                frame_to_send = self._get_transitioning_frame()
-            else: # NORMAL state
-                frame_to_send = self._get_normal_frame()
+            # Fill up to PIPE_FRAMES_PER_WRITE frames, stopping early if audio runs out
+            # or the transition finishes, then send them with a single write
+            frames_ready = 0
+            while frames_ready < PIPE_FRAMES_PER_WRITE:
+                if self._transitions_started != self._transition_requests:
+                    self._begin_transition()
+                frame = self._pipe_frames[frames_ready]
+                if self.transition_state == 'TRANSITIONING':
+                    got_frame = self._get_transitioning_frame(frame)
+                else: # NORMAL state
+                    got_frame = self._get_normal_frame(frame)
+                if not got_frame:
+                    break
+                frames_ready += 1
 
-            if frame_to_send is not None:
+            if frames_ready:
                 try:
-                    os.write(self.pipe_handle, frame_to_send.tobytes())
+                    self._write_to_pipe(self._pipe_scratch_bytes[:frames_ready * self._pipe_frame_bytes])
                 except Exception as e:
                     print(f"ERROR writing to pipe (likely closed): {e}")
                     self.stop_event.set()
@@ -196,80 +436,169 @@ class ContinuousMusicPipeWriter:
         if self.pipe_handle:
             os.close(self.pipe_handle)
 
-    def _get_normal_frame(self):
-        """Gets one frame of audio in the NORMAL state."""
-        with self.buffer_lock:
-            # Buffer more audio if we don't have enough for a full frame
-            while len(self.buffered_audio) < PIPE_FRAME_SIZE:
-                try:
-                    new_chunk = self.generation_queue.get_nowait()
-                    self.buffered_audio = np.vstack([self.buffered_audio, new_chunk])
-                except queue.Empty:
-                    return None # Not enough data available right now
-
-            # Extract one frame
-            frame = self.buffered_audio[:PIPE_FRAME_SIZE]
-            self.buffered_audio = self.buffered_audio[PIPE_FRAME_SIZE:]
-            return frame
-
-    def _get_transitioning_frame(self):
-        """Gets one frame of audio by mixing old and new genres."""
-        with self.buffer_lock:
-            # --- Check if transition is finished ---
-            elapsed = time.time() - self.transition_start_time
-            if elapsed >= self.transition_duration:
-                print("   Crossfade transition complete. Switching to NORMAL state.")
-                self.transition_state = 'NORMAL'
-                self.fade_out_buffer = np.array([], dtype=np.int16).reshape(0, self.channels)
-                # Any remaining old audio is discarded, which is fine.
-                return None # Let the normal loop take over
-
-            # --- Get audio from OLD genre buffer ---
-            if len(self.fade_out_buffer) >= PIPE_FRAME_SIZE:
-                old_frame = self.fade_out_buffer[:PIPE_FRAME_SIZE].astype(np.float32) / 32767.0
-                self.fade_out_buffer = self.fade_out_buffer[PIPE_FRAME_SIZE:]
-            else:
-                # Pad with silence if old genre buffer is exhausted before transition ends
-                old_frame = np.zeros((PIPE_FRAME_SIZE, self.channels), dtype=np.float32)
+    def _write_to_pipe(self, data):
+        """Writes data, waiting at most PIPE_STALL_TIMEOUT_MS at a time for the reader to make room.
 
-            # --- Get audio from NEW genre buffer ---
-            # This logic is identical to _get_normal_frame, ensuring we have new audio
-            while len(self.buffered_audio) < PIPE_FRAME_SIZE:
-                try:
-                    new_chunk = self.generation_queue.get_nowait()
-                    self.buffered_audio = np.vstack([self.buffered_audio, new_chunk])
-                except queue.Empty:
-                    return None # Not enough new genre data yet, wait.
-            
-            new_frame = self.buffered_audio[:PIPE_FRAME_SIZE].astype(np.float32) / 32767.0
-            self.buffered_audio = self.buffered_audio[PIPE_FRAME_SIZE:]
+        If the reader is stalled before any of the batch went out, the batch is dropped instead
+        of backing up the generator. Once part of it is written, the rest has to follow so the
+        stream stays aligned to whole samples.
+        """
+        batch_size = len(data)
+        while data and not self.stop_event.is_set():
+            if not self._pipe_poll.poll(PIPE_STALL_TIMEOUT_MS):
+                if len(data) == batch_size:
+                    self.pipe_overruns += 1
+                    if self.pipe_overruns % 10 == 1:
+                        print(f"WARNING: Pipe reader stalled, dropped {self.pipe_overruns} batch(es) so far")
+                    return
+                continue
+            try:
+                data = data[os.write(self.pipe_handle, data):]
+            except BlockingIOError:
+                continue
 
-            # --- Mix the frames ---
-            progress = min(elapsed / self.transition_duration, 1.0) # Clamp progress to 1.0
-            
-            # Smoother, more gradual crossfade curve
-            # Use a smoothstep function for more gradual transitions
-            smooth_progress = progress * progress * (3.0 - 2.0 * progress)  # smoothstep
-            fade_out_volume = 1.0 - smooth_progress  # Fades 1 to 0
-            fade_in_volume = smooth_progress  # Fades 0 to 1
-            
-            mixed_frame_float = (old_frame * fade_out_volume) + (new_frame * fade_in_volume)
-            
-            # Clip and convert back to int16
-            return (np.clip(mixed_frame_float, -1.0, 1.0) * 32767).astype(np.int16)
+    def _begin_transition(self):
+        """Moves the buffered audio of the OLD genre into fade_out_buffers and enters the transition.
+
+        Old-genre chunks still queued or in flight are added to fade_out_buffers as they arrive
+        (see _buffer_next_chunk); the crossfade starts once the new genre's audio comes through.
+        """
+        self._transitions_started = self._transition_requests
+
+        # Start with the partially-used chunk in the main buffer, which also empties it
+        # so it can start filling with the NEW genre's audio. The ring reuses its storage,
+        # so this is the one piece that has to be copied out.
+        if self.transition_state == 'TRANSITIONING' and self.transition_frame_index == 0:
+            # The previous change hadn't started crossfading yet, so its OLD audio is still
+            # what is playing; keep it
+            fade_out_buffers = self.fade_out_buffers
+        else:
+            fade_out_buffers = collections.deque()
+        if len(self.buffered_audio):
+            fade_out_buffers.append(self.buffered_audio.read(len(self.buffered_audio)).copy())
+
+        self.fade_out_buffers = fade_out_buffers
+        self.transition_state = 'TRANSITIONING'
+        self.transition_frame_index = 0
+
+    def _buffer_next_chunk(self):
+        """Takes the next queued chunk and files it by genre. Returns False if the queue is empty.
+
+        Chunks of the genre now playing go into buffered_audio. During a transition, older chunks
+        are the OLD genre's audio and go into fade_out_buffers; queued chunks are no longer
+        referenced anywhere else, so they are kept as they are rather than stacked into one array.
+        """
+        try:
+            tag, audio = self.generation_queue.get_nowait()
+        except queue.Empty:
+            return False
+        if tag > self._transitions_started:
+            # Generated after a genre change the writer hasn't picked up yet
+            self._begin_transition()
+        if tag == self._transitions_started:
+            self.buffered_audio.write(audio)
+        elif self.transition_state == 'TRANSITIONING':
+            self.fade_out_buffers.append(audio)
+        # Otherwise it is left over from a genre that has already been faded out; drop it
+        return True
+
+    def _get_normal_frame(self, out):
+        """Encodes one frame of audio in the NORMAL state into out. Returns False if none is available."""
+        # Buffer more audio if we don't have enough for a full frame
+        while len(self.buffered_audio) < PIPE_FRAME_SIZE:
+            if not self._buffer_next_chunk():
+                return False # Not enough data available right now
+            if self.transition_state == 'TRANSITIONING':
+                return False # That was the first chunk of a new genre; let the transition take over
+
+        # Extract one frame and encode it into the pipe scratch buffer
+        _float_to_int16(self.buffered_audio.read(PIPE_FRAME_SIZE), out)
+        return True
+
+    def _get_transitioning_frame(self, out):
+        """Encodes one frame of audio mixing old and new genres into out. Returns False if none was produced."""
+        # --- Check if transition is finished ---
+        frame_index = self.transition_frame_index
+        if frame_index >= self.transition_frames:
+            print("   Crossfade transition complete. Switching to NORMAL state.")
+            self.transition_state = 'NORMAL'
+            self.fade_out_buffers.clear()
+            # Any remaining old audio is discarded, which is fine.
+            return False # Let the normal loop take over
+
+        # --- Make sure NEW genre audio is available before consuming any OLD audio ---
+        # Old-genre chunks pulled along the way are appended to fade_out_buffers
+        while len(self.buffered_audio) < PIPE_FRAME_SIZE:
+            if not self._buffer_next_chunk():
+                break
+        if len(self.buffered_audio) < PIPE_FRAME_SIZE:
+            if frame_index == 0 and sum(len(b) for b in self.fade_out_buffers) >= PIPE_FRAME_SIZE:
+                # The new genre hasn't made it through the pipeline yet: keep playing the
+                # OLD genre as it is, and start the crossfade once the new one arrives
+                _float_to_int16(self._next_fade_out_frame(), out)
+                return True
+            return False # Not enough new genre data yet, wait.
+
+        # --- Get audio from OLD genre buffer ---
+        old_frame = self._next_fade_out_frame()
+        new_frame = self.buffered_audio.read(PIPE_FRAME_SIZE)
+
+        # --- Mix the frames using the precomputed smoothstep curve, clip and encode to int16 ---
+        _mix_to_int16(old_frame, new_frame, self._fade_out_curve[frame_index], self._fade_in_curve[frame_index], out)
+        self.transition_frame_index = frame_index + 1
+        return True
+
+    def _next_fade_out_frame(self):
+        """Takes the next frame of OLD genre audio off fade_out_buffers, as a view where possible."""
+        buffers = self.fade_out_buffers
+        if not buffers:
+            # Pad with silence if old genre buffer is exhausted before transition ends
+            return self._silent_frame
+
+        head = buffers[0]
+        if len(head) >= PIPE_FRAME_SIZE:
+            if len(head) == PIPE_FRAME_SIZE:
+                buffers.popleft()
+            else:
+                buffers[0] = head[PIPE_FRAME_SIZE:]
+            return head[:PIPE_FRAME_SIZE]
+
+        # The frame straddles two chunks (or the old audio runs out part way through it),
+        # so only this one small frame gets stitched together
+        parts = []
+        needed = PIPE_FRAME_SIZE
+        while buffers and needed:
+            head = buffers[0]
+            part = head[:needed]
+            parts.append(part)
+            needed -= len(part)
+            if len(part) == len(head):
+                buffers.popleft()
+            else:
+                buffers[0] = head[len(part):]
+        if needed:
+            parts.append(self._silent_frame[:needed])
+        return np.concatenate(parts)
 
     def start(self):
         self.stop_event.clear()
         self.generator_thread = threading.Thread(target=self._generation_loop)
         self.generator_thread.daemon = True
+        self.post_process_thread = threading.Thread(target=self._post_process_loop)
+        self.post_process_thread.daemon = True
         self.pipe_writer_thread = threading.Thread(target=self._pipe_writer_loop)
         self.pipe_writer_thread.daemon = True
         self.genre_monitor_thread = threading.Thread(target=self._monitor_genre_changes)
         self.genre_monitor_thread.daemon = True
+        self.embedding_prefetch_thread = threading.Thread(target=self._prefetch_embeddings)
+        self.embedding_prefetch_thread.daemon = True
 
         self.generator_thread.start()
+        self.post_process_thread.start()
         self.pipe_writer_thread.start()
         self.genre_monitor_thread.start()
+        self.embedding_prefetch_thread.start()
+        self._pin_threads()
 
         print("\nMusic generator is running. Connect a client to start the stream.")
         try:
@@ -277,13 +606,47 @@ class ContinuousMusicPipeWriter:
         except KeyboardInterrupt: print("\nInterrupted by user.")
         finally: self.stop()
             
+    def _pin_threads(self):
+        """Best effort: gives the pipe writer its own core at SCHED_FIFO priority and keeps the other threads off it.
+
+        Realtime priority needs CAP_SYS_NICE (docker run --cap-add=SYS_NICE); without it the writer keeps normal priority.
+        """
+        if not hasattr(os, "sched_setaffinity"):
+            return
+        cores = sorted(os.sched_getaffinity(0))
+        if len(cores) < 2:
+            return
+        writer_cores = {cores[-1]}
+        other_cores = set(cores[:-1])
+
+        threads = [
+            (self.pipe_writer_thread, writer_cores),
+            (self.generator_thread, other_cores),
+            (self.post_process_thread, other_cores),
+            (self.genre_monitor_thread, other_cores),
+            (self.embedding_prefetch_thread, other_cores),
+        ]
+        for thread, thread_cores in threads:
+            try:
+                os.sched_setaffinity(thread.native_id, thread_cores)
+            except OSError:
+                pass # The thread already exited (e.g. the prefetch finished)
+
+        try:
+            os.sched_setscheduler(self.pipe_writer_thread.native_id, os.SCHED_FIFO, os.sched_param(20))
+            print(f"Pipe writer pinned to core {cores[-1]} with SCHED_FIFO priority.")
+        except OSError as e:
+            print(f"Pipe writer pinned to core {cores[-1]} (realtime priority unavailable: {e})")
+
     def stop(self):
         if self.stop_event.is_set(): return
         print("\nStopping music writer...")
         self.stop_event.set()
         if self.pipe_writer_thread and self.pipe_writer_thread.is_alive(): self.pipe_writer_thread.join(timeout=2)
         if self.generator_thread and self.generator_thread.is_alive(): self.generator_thread.join(timeout=2)
+        if self.post_process_thread and self.post_process_thread.is_alive(): self.post_process_thread.join(timeout=2)
         if self.genre_monitor_thread and self.genre_monitor_thread.is_alive(): self.genre_monitor_thread.join(timeout=2)
+        if self.embedding_prefetch_thread and self.embedding_prefetch_thread.is_alive(): self.embedding_prefetch_thread.join(timeout=2)
         print("Music writer stopped.")
 
 if __name__ == "__main__":
@@ -5,70 +5,220 @@ LLM DJ - Uses local LLM to determine music genre based on activity
 
 import time
 import sys
+import asyncio
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import argparse
-import json
-import base64
+try:
+    import orjson  # Faster parser for the LLM's JSON replies
+except ImportError:
+    import json as orjson
+try:
+    import pybase64 as base64  # SIMD base64, a drop-in for the stdlib module
+except ImportError:
+    import base64
+import gzip
+import re
 from io import BytesIO
+import numpy as np
 from PIL import Image
 import mss
-from openai import OpenAI
+from openai import AsyncOpenAI
 
+# Screens whose dHashes differ in fewer bits than this count as unchanged and aren't re-analyzed
+SCREEN_CHANGE_THRESHOLD = 5
+# Longest edge of the screenshot sent to the LLM. Anything past the vision encoder's native
+# input size is just downsampled again server-side, so known models get their own size
+DEFAULT_VISION_SIZE = 512
+MODEL_VISION_SIZES = {
+    "llava": 336,
+    "phi": 336,
+    "moondream": 378,
+    "qwen": 448,
+    "minicpm": 448,
+}
 
-def examine_activity(debug=False, monitor_index=0):
-    """Take a screenshot of the current screen and return it as a base64 encoded string."""
+# While the genre stays the same the capture interval doubles, up to this multiple of --interval
+MAX_INTERVAL_FACTOR = 8
+
+
+# Structured output schema for the LLM's reply, so it can only answer with bare JSON
+GENRE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "genre",
+        "schema": {
+            "type": "object",
+            "properties": {"music_genre": {"type": "string", "maxLength": 32}},
+            "required": ["music_genre"],
+        },
+    },
+}
+
+# With --compress-requests, request bodies at least this big (i.e. ones carrying screenshots) are gzipped
+GZIP_MIN_BODY_SIZE = 64 * 1024
+
+# Last-resort pattern for pulling the genre out of a reply that isn't valid JSON
+_JSON_FALLBACK = re.compile(r'\{"music_genre":\s*"([^"]+)"\}')
+
+# Keep-alive session for genre updates, so each change reuses the connection to the music server
+_SESSION = requests.Session()
+_SESSION.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+# One capture handle, opened on first use and reused every cycle. mss handles aren't
+# thread-safe (on Windows they're tied to the thread that opened them), so captures
+# all run on _CAPTURE_EXECUTOR's single thread, under _SCT_LOCK.
+_SCT = None
+_MONITORS = None  # Snapshot of _SCT.monitors taken when the handle is opened
+_SCT_LOCK = threading.Lock()
+_CAPTURE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+# Resizing and JPEG encoding happen here instead (PIL releases the GIL while it works), so
+# the capture thread is free for the next grab and the event loop for the LLM call
+_ENCODE_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="encode")
+
+
+def screen_hash(img):
+    """Returns a 64-bit difference hash (dHash) of the image for cheap change detection."""
+    pixels = list(img.convert("L").resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = (value << 1) | (left > pixels[row * 9 + col + 1])
+    return value
+
+
+def get_monitors():
+    """Returns the monitor list, opening the shared capture handle if needed. Call with _SCT_LOCK held."""
+    global _SCT, _MONITORS
+    if _SCT is None:
+        _SCT = mss.mss()
+        _MONITORS = list(_SCT.monitors)
+    return _MONITORS
+
+
+def describe_monitor(monitor_index):
+    """Returns a one-line description of the monitor that will be captured."""
+    with _SCT_LOCK:
+        monitors = get_monitors()
+    if monitor_index == 0:
+        return "All monitors combined"
+    if monitor_index < len(monitors):
+        monitor = monitors[monitor_index]
+        return f"Monitor {monitor_index} ({monitor['width']}x{monitor['height']})"
+    return f"{monitor_index} (will fallback to all monitors)"
+
+
+def grab_screen(monitor_index=0):
+    """Grab the raw pixels of the chosen monitor. Returns None if the capture failed."""
+    global _SCT, _MONITORS
     try:
-        with mss.mss() as sct:
+        with _SCT_LOCK:
+            monitors = get_monitors()
+            
             # Take screenshot to share to the LLM
             # monitor_index 0 = all monitors combined, 1+ = specific monitor
-            if monitor_index >= len(sct.monitors):
+            if monitor_index >= len(monitors):
                 print(f"   WARNING: Monitor {monitor_index} not found, using all monitors")
                 monitor_index = 0
             
-            monitor = sct.monitors[monitor_index]
+            monitor = monitors[monitor_index]
             if monitor_index == 0:
                 print(f"   Examining all monitors combined")
             else:
                 print(f"   Examining monitor {monitor_index}")
-            screenshot = sct.grab(monitor)
-            
-            # Convert to PIL Image
-            img = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
-            
-            # Resize image to reduce file size (optional, but recommended for LLM processing)
-            # Keep aspect ratio but limit max dimension to 1024px
-            max_size = 1024
-            if img.width > max_size or img.height > max_size:
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            # Debug: Show the screenshot that will be sent
-            if debug:
-                print("   DEBUG: Opening screenshot preview...")
-                img.show()
-            
-            # Convert to base64
-            buffer = BytesIO()
-            img.save(buffer, format="PNG")
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            
-            return img_str
+            return _SCT.grab(monitor)
     except Exception as e:
         print(f"ERROR: Failed to take screenshot: {e}")
+        # Reopen the capture handle next cycle in case it went stale (e.g. display reconfigured)
+        with _SCT_LOCK:
+            if _SCT is not None:
+                _SCT.close()
+                _SCT = None
+                _MONITORS = None
         return None
 
 
-def get_genre_from_llm_local(client, model_name, screenshot_b64):
-    """Use local OpenAI-compatible server to get music genre from screenshot."""
+def vision_size_for(model_name):
+    """Picks the screenshot size for a model from MODEL_VISION_SIZES, by substring of its name."""
+    model_name = model_name.lower()
+    for key, size in MODEL_VISION_SIZES.items():
+        if key in model_name:
+            return size
+    return DEFAULT_VISION_SIZE
+
+
+def encode_screenshot(screenshot, debug=False, grayscale=True, max_size=DEFAULT_VISION_SIZE):
+    """Shrink a grabbed screenshot and return it as a base64 encoded string, plus its dHash."""
+    try:
+        # Resize image to reduce file size (optional, but recommended for LLM processing)
+        # Keep aspect ratio but limit max dimension to max_size
+        # Convert to PIL Image. The BGRA -> RGB swap is a single strided numpy copy, and
+        # large captures are decimated by an integer stride in the same copy, so LANCZOS
+        # only has to filter a near-target-size image
+        step = max(1, max(screenshot.width, screenshot.height) // max_size)
+        bgra = np.frombuffer(screenshot.bgra, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+        img = Image.fromarray(np.ascontiguousarray(bgra[::step, ::step, 2::-1]))
+        
+        if img.width > max_size or img.height > max_size:
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        
+        # Telling a code editor from a game doesn't need color, and a single channel
+        # means fewer bytes to send and less for the vision encoder to process
+        if grayscale:
+            img = img.convert("L")
+        
+        img_hash = screen_hash(img)
+        
+        # Debug: Show the screenshot that will be sent
+        if debug:
+            print("   DEBUG: Opening screenshot preview...")
+            img.show()
+        
+        # Convert to base64. JPEG encodes much faster than PNG and gives the
+        # vision model a far smaller payload to decode
+        buffer = BytesIO()
+        if grayscale:
+            img.save(buffer, format="JPEG", quality=70, optimize=False)
+        else:
+            img.save(buffer, format="JPEG", quality=80, subsampling=2, optimize=False)
+        # getbuffer() exposes the encoded bytes in place instead of copying them out first
+        img_str = base64.b64encode(buffer.getbuffer()).decode("ascii")
+        
+        return img_str, img_hash
+    except Exception as e:
+        print(f"ERROR: Failed to encode screenshot: {e}")
+        return None, None
+
+
+def examine_activity(debug=False, monitor_index=0, grayscale=True, max_size=DEFAULT_VISION_SIZE):
+    """Take a screenshot of the current screen and return it as a base64 encoded string, plus its dHash."""
+    screenshot = grab_screen(monitor_index)
+    if screenshot is None:
+        return None, None
+    return encode_screenshot(screenshot, debug=debug, grayscale=grayscale, max_size=max_size)
+
+
+async def get_genre_from_llm_local(client, model_name, screenshots_b64):
+    """Use local OpenAI-compatible server to get music genre from one or more screenshots (oldest first)."""
     try:
         print(f"-> Analyzing activity with local model '{model_name}'...")
         
+        if len(screenshots_b64) == 1:
+            intro = "You are given one image."
+        else:
+            intro = f"You are given {len(screenshots_b64)} screenshots taken a few seconds apart, oldest first. Judge the activity mostly by the latest one."
+        
         # Request JSON output via optimized system prompt
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model_name,
             messages=[
                 {
                     "role": "system",
-                    "content": "### SYSTEM\nYou are given one image.\n\n### INSTRUCTION\n1. Silently infer what the user is doing in the screenshot.\n2. Pick one 1-2-word music genre that fits the activity.\n   *Think step-by-step internally only.*\n3. Return a JSON object that conforms to the provided schema.\n   **Do not output anything else.**\n\n### RESPONSE FORMAT\n{\"music_genre\": \"<genre>\"}"
+                    "content": f"### SYSTEM\n{intro}\n\n### INSTRUCTION\n1. Silently infer what the user is doing in the screenshot.\n2. Pick one 1-2-word music genre that fits the activity.\n   *Think step-by-step internally only.*\n3. Return a JSON object that conforms to the provided schema.\n   **Do not output anything else.**\n\n### RESPONSE FORMAT\n{{\"music_genre\": \"<genre>\"}}"
                 },
                 {
                     "role": "user",
@@ -76,36 +226,33 @@ def get_genre_from_llm_local(client, model_name, screenshot_b64):
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{screenshot_b64}"
+                                "url": f"data:image/jpeg;base64,{screenshot_b64}"
                             }
                         }
+                        for screenshot_b64 in screenshots_b64
                     ]
                 }
             ],
-            max_tokens=50,
-            temperature=0.0
+            # A 1-2 word genre in the schema's JSON object fits comfortably in 16 tokens
+            max_tokens=16,
+            temperature=0.0,
+            response_format=GENRE_RESPONSE_FORMAT
         )
         
         content = response.choices[0].message.content
         
         try:
-            # First, strip any markdown code blocks that might wrap the JSON
-            import re
-            # Remove ```json and ``` markers
-            cleaned_content = re.sub(r'^```(?:json)?\s*\n?', '', content.strip(), flags=re.MULTILINE)
-            cleaned_content = re.sub(r'\n?```\s*$', '', cleaned_content, flags=re.MULTILINE)
-            
-            genre_data = json.loads(cleaned_content.strip())
+            # The response format constrains the reply to bare JSON, so no code fences to strip
+            genre_data = orjson.loads(content.strip())
             if "music_genre" in genre_data and isinstance(genre_data["music_genre"], str):
                 return genre_data["music_genre"]
             else:
                 print(f"   WARNING: 'music_genre' key missing or invalid in LLM response: {content}")
                 return None
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             print(f"   WARNING: Could not parse JSON from LLM response: {content}")
             # Try to find JSON-like pattern in the text as fallback
-            import re
-            match = re.search(r'\{"music_genre":\s*"([^"]+)"\}', content)
+            match = _JSON_FALLBACK.search(content)
             if match:
                 return match.group(1)
             return None
@@ -115,13 +262,51 @@ def get_genre_from_llm_local(client, model_name, screenshot_b64):
         return None
 
 
+async def warm_up_model(client, model_name):
+    """Sends a tiny image prompt so model loading and vision-encoder setup happen before the first real cycle."""
+    try:
+        buffer = BytesIO()
+        Image.new("L", (32, 32)).save(buffer, format="JPEG")
+        tiny_b64 = base64.b64encode(buffer.getbuffer()).decode("ascii")
+        await client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "ok"},
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{tiny_b64}"}},
+                    ]
+                }
+            ],
+            max_tokens=1
+        )
+        print("   Model warmed up.")
+    except Exception as e:
+        print(f"   WARNING: Model warm-up failed: {e}")
+
+
+async def gzip_request_body(request):
+    """httpx request hook: gzips large request bodies before they're sent to LM Studio."""
+    import httpx
+    
+    body = request.read()
+    if len(body) < GZIP_MIN_BODY_SIZE or "Content-Encoding" in request.headers:
+        return
+    compressed = gzip.compress(body, compresslevel=1)
+    request.stream = httpx.ByteStream(compressed)
+    request._content = compressed
+    request.headers["Content-Encoding"] = "gzip"
+    request.headers["Content-Length"] = str(len(compressed))
+
+
 def change_server_genre(server_ip, server_port, genre):
     """Sends a POST request to the music server to change the genre."""
     url = f"http://{server_ip}:{server_port}/genre"
     payload = {"genre": genre}
     print(f"-> Attempting to change genre to '{genre}'...")
     try:
-        response = requests.post(url, json=payload, timeout=5)
+        response = _SESSION.post(url, json=payload, timeout=5)
         response.raise_for_status()
         print(f"   SUCCESS: Genre changed to '{response.json().get('genre', genre)}'.")
         return True
@@ -130,26 +315,74 @@ def change_server_genre(server_ip, server_port, genre):
         return False
 
 
-def main(args):
-    """Main loop to take screenshots, get genre suggestions, and update music."""
+class AdaptiveInterval:
+    """Capture interval that backs off while the suggested genre stays the same."""
+
+    def __init__(self, base):
+        self.base = base
+        self.current = base
+
+    def backoff(self):
+        self.current = min(self.current * 2, self.base * MAX_INTERVAL_FACTOR)
+
+    def reset(self):
+        self.current = self.base
+
+
+async def queue_screenshot(args, screenshot, previous, pending, frame_ready):
+    """Encodes a grabbed screenshot on the encode pool and queues it in pending, in capture order."""
+    loop = asyncio.get_running_loop()
+    screenshot_b64, screen_hash_value = await loop.run_in_executor(
+        _ENCODE_EXECUTOR, encode_screenshot, screenshot, args.debug, args.grayscale, args.vision_size
+    )
+    if previous is not None:
+        await previous
+    if screenshot_b64:
+        pending.append((screenshot_b64, screen_hash_value))
+        frame_ready.set()
+    else:
+        print("   Skipping this cycle due to screenshot failure.")
+
+
+async def capture_loop(args, interval, pending, frame_ready):
+    """Takes a screenshot every interval.current seconds on the capture thread and queues it in pending.
+
+    Capturing carries on while the LLM is busy; whatever piles up meanwhile is sent
+    to it as one batch.
+    """
+    loop = asyncio.get_running_loop()
+    previous = None
+    while True:
+        print(f"\n--- Screen Activity Analysis cycle at {time.strftime('%H:%M:%S')} ---")
+        screenshot = await loop.run_in_executor(_CAPTURE_EXECUTOR, grab_screen, args.monitor)
+        if screenshot is None:
+            print("   Skipping this cycle due to screenshot failure.")
+        else:
+            previous = asyncio.create_task(queue_screenshot(args, screenshot, previous, pending, frame_ready))
+        await asyncio.sleep(interval.current)
+
+
+async def main(args):
+    """Main loop to take screenshots, get genre suggestions, and update music.
+
+    Capture and inference are pipelined: screenshots keep being taken every interval
+    while the LLM works, and the ones taken meanwhile go to it together in one call.
+    """
     lm_studio_url = "http://localhost:1234/v1"  # Only talk to local LM Studio
     
     print("--- LLM DJ Starting ---")
-    print(f"Screen Activity Analysis every {args.interval} seconds")
+    print(f"Screen Activity Analysis every {args.interval} seconds (up to {args.interval * MAX_INTERVAL_FACTOR} while the genre holds)")
     print(f"LM Studio URL: {lm_studio_url}")
     print(f"LM Studio Model: {args.model}")
+    if not args.vision_size:
+        args.vision_size = vision_size_for(args.model)
+    print(f"Screenshot size: {args.vision_size}px")
     print(f"Music Server: http://{args.music_ip}:{args.music_port}/genre")
     
-    # Show monitor info
+    # Show monitor info, using the capture thread's handle rather than opening a second one
     try:
-        with mss.mss() as sct:
-            if args.monitor == 0:
-                print(f"Monitor: All monitors combined")
-            elif args.monitor < len(sct.monitors):
-                monitor = sct.monitors[args.monitor]
-                print(f"Monitor: Monitor {args.monitor} ({monitor['width']}x{monitor['height']})")
-            else:
-                print(f"Monitor: {args.monitor} (will fallback to all monitors)")
+        loop = asyncio.get_running_loop()
+        print(f"Monitor: {await loop.run_in_executor(_CAPTURE_EXECUTOR, describe_monitor, args.monitor)}")
     except Exception as e:
         print(f"Monitor: Unable to detect monitor info - {e}")
     
@@ -162,11 +395,12 @@ def main(args):
         import httpx
         
         # Create a custom httpx client with proper SSL context
-        http_client = httpx.Client(
-            verify=False  # Since we're connecting to localhost, we can disable SSL verification
+        http_client = httpx.AsyncClient(
+            verify=False,  # Since we're connecting to localhost, we can disable SSL verification
+            event_hooks={"request": [gzip_request_body]} if args.compress_requests else None
         )
         
-        client = OpenAI(
+        client = AsyncOpenAI(
             base_url=lm_studio_url, 
             api_key="lm-studio",
             http_client=http_client
@@ -174,47 +408,67 @@ def main(args):
     except Exception as e:
         # Fallback to basic client if SSL packages not available
         print(f"   WARNING: SSL configuration failed ({e}), using basic client")
-        client = OpenAI(base_url=lm_studio_url, api_key="lm-studio")
+        client = AsyncOpenAI(base_url=lm_studio_url, api_key="lm-studio")
+    
+    # Warm the model up while the first screenshot is being captured
+    warmup_task = asyncio.create_task(warm_up_model(client, args.model))
     
     last_genre = None
+    last_hash = None  # dHash of the last screen the LLM analyzed
+    
+    # Screenshots waiting for the LLM; only the newest max_batch are kept
+    pending = collections.deque(maxlen=max(1, args.max_batch))
+    frame_ready = asyncio.Event()
+    interval = AdaptiveInterval(args.interval)
+    capture_task = asyncio.create_task(capture_loop(args, interval, pending, frame_ready))
     
     try:
         while True:
-            print(f"\n--- Screen Activity Analysis cycle at {time.strftime('%H:%M:%S')} ---")
+            # Wait for at least one new screenshot, then take everything queued since the last call
+            await frame_ready.wait()
+            frame_ready.clear()
+            batch = list(pending)
+            pending.clear()
             
-            # Take screenshot
-            screenshot_b64 = examine_activity(debug=args.debug, monitor_index=args.monitor)
-            if not screenshot_b64:
-                print("   Skipping this cycle due to screenshot failure.")
-                time.sleep(args.interval)
+            # Skip the LLM round trip entirely if the screen looks the same as last time
+            if last_hash is not None and all(
+                bin(last_hash ^ screen_hash_value).count("1") < SCREEN_CHANGE_THRESHOLD
+                for _, screen_hash_value in batch
+            ):
+                print("   Screen unchanged, skipping analysis.")
                 continue
             
+            if len(batch) > 1:
+                print(f"   Batching {len(batch)} screenshots into one request")
+            
             # Pass the client instance to the function
-            suggested_genre = get_genre_from_llm_local(client, args.model, screenshot_b64)
+            suggested_genre = await get_genre_from_llm_local(client, args.model, [screenshot_b64 for screenshot_b64, _ in batch])
             if not suggested_genre:
                 print("   No genre suggestion received from LLM.")
-                time.sleep(args.interval)
                 continue
             
+            last_hash = batch[-1][1]
             print(f"   LLM suggested genre: '{suggested_genre}'")
             
             # Only change if it's different from the last genre
             if suggested_genre.lower() != str(last_genre).lower():
-                if change_server_genre(args.music_ip, args.music_port, suggested_genre):
+                if await asyncio.to_thread(change_server_genre, args.music_ip, args.music_port, suggested_genre):
                     last_genre = suggested_genre
+                    interval.reset()
                 else:
                     print("   Failed to change genre on music server.")
             else:
                 print("   Genre unchanged, skipping server update.")
+                interval.backoff()
+                print(f"   Capture interval now {interval.current} seconds")
             
-            # Wait for next cycle
-            time.sleep(args.interval)
-            
-    except KeyboardInterrupt:
-        print("\n--- LLM DJ Stopping ---")
     except Exception as e:
         print(f"\nAn unexpected error occurred: {e}")
         sys.exit(1)
+    finally:
+        capture_task.cancel()
+        warmup_task.cancel()
+        await client.close()
 
 
 if __name__ == "__main__":
@@ -225,7 +479,11 @@ if __name__ == "__main__":
     parser.add_argument("music_port", type=int, help="Port of the music server")
     parser.add_argument("--model", default="local-model", help="Model identifier to use (default: 'local-model', which LM Studio often uses)")
     parser.add_argument("--interval", type=int, default=10, help="Interval in seconds between screen analysis (default: 10)")
+    parser.add_argument("--max-batch", type=int, default=4, help="Most screenshots sent in one LLM request when captures pile up behind a slow model (default: 4)")
     parser.add_argument("--monitor", type=int, default=1, help="Monitor to capture (0=all monitors, 1=first monitor, 2=second monitor, etc.)")
+    parser.add_argument("--vision-size", type=int, default=None, help=f"Longest edge in pixels of screenshots sent to the LLM (default: picked from the model name, else {DEFAULT_VISION_SIZE})")
+    parser.add_argument("--grayscale", action=argparse.BooleanOptionalAction, default=True, help="Send screenshots to the LLM in grayscale (default: on; use --no-grayscale for color)")
+    parser.add_argument("--compress-requests", action="store_true", help="Gzip large request bodies sent to LM Studio (the server must accept Content-Encoding: gzip)")
     parser.add_argument("--list-monitors", action="store_true", help="List available monitors and exit")
     parser.add_argument("--debug", action="store_true", help="Show screenshot preview before sending to LLM to determine monitor")
     
@@ -245,4 +503,7 @@ if __name__ == "__main__":
             print(f"Error listing monitors: {e}")
         sys.exit(0)
     
-    main(parsed_args)
+    try:
+        asyncio.run(main(parsed_args))
+    except KeyboardInterrupt:
+        print("\n--- LLM DJ Stopping ---")
@@ -4,14 +4,87 @@ import os
 import webbrowser
 import sys
 import signal
+import select
+import time
+import threading
+import psutil
+import mss
 from Quartz import CGWindowListCopyWindowInfo, kCGWindowListOptionOnScreenOnly, kCGNullWindowID
-from Cocoa import (NSApplication, NSWindow, NSTextView, NSScrollView, NSMakeRect, 
+from Cocoa import (NSApplication, NSWindow, NSTextView, NSScrollView, NSMakeRect, NSMakeSize,
                    NSWindowStyleMaskTitled, NSWindowStyleMaskClosable, NSWindowStyleMaskResizable, 
-                   NSBackingStoreBuffered, NSFont, NSViewWidthSizable, NSViewHeightSizable)
-from Foundation import NSObject, NSTimer
+                   NSBackingStoreBuffered, NSFont, NSViewWidthSizable, NSViewHeightSizable,
+                   NSAttributedString, NSColor, NSFontAttributeName, NSForegroundColorAttributeName,
+                   NSApplicationDidChangeScreenParametersNotification)
+from Foundation import NSObject, NSNotificationCenter, NSString, NSUTF8StringEncoding
+from PyObjCTools import AppHelper
 import objc
 
 APP_ICON = "icon.png"
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Paths of the scripts run by ProcessRunner, by name; the names are also looked for when
+# cleaning up orphaned DJ processes
+DJ_SCRIPTS = {name: os.path.join(APP_DIR, name) for name in ('llm_dj.py', 'process_dj.py')}
+# Checked once here; the app bundle doesn't change while we run
+MISSING_DJ_SCRIPTS = {name for name, path in DJ_SCRIPTS.items() if not os.path.exists(path)}
+# PID of the running DJ process, so the next launch can clean it up if the app died without stopping it
+DJ_PID_FILE = os.path.expanduser("~/Library/Application Support/InfiniteRadio/dj.pid")
+
+# stop() gives the DJ this many seconds to exit after SIGTERM, checking every STOP_POLL_INTERVAL,
+# before killing it
+STOP_GRACE_PERIOD = 0.5
+STOP_POLL_INTERVAL = 0.01
+# Bytes of timestamped DJ output kept for the console; the oldest output is overwritten once it's full
+OUTPUT_BUFFER_SIZE = 256 * 1024
+# Largest read from the DJ process's output pipe; a burst of log lines comes in with one syscall
+OUTPUT_READ_SIZE = 65536
+# The console folds all output that arrives within this many seconds into one text update
+CONSOLE_FLUSH_INTERVAL = 0.1
+
+# (width, height) of each mss monitor (index 0 = all monitors combined). Filled on first use and
+# dropped by ScreenChangeObserver when displays change, so menu builds don't re-probe displays.
+_MONITOR_CACHE = None
+
+def get_monitors():
+    """Returns the cached monitor sizes, enumerating displays only if the cache is empty."""
+    global _MONITOR_CACHE
+    if _MONITOR_CACHE is None:
+        with mss.mss() as sct:
+            _MONITOR_CACHE = [(monitor['width'], monitor['height']) for monitor in sct.monitors]
+    return _MONITOR_CACHE
+
+class ScreenChangeObserver(NSObject):
+    """Invalidates the monitor cache when displays are added, removed or rearranged."""
+    
+    def screenParametersChanged_(self, notification):
+        global _MONITOR_CACHE
+        _MONITOR_CACHE = None
+
+def write_pid_file(pid):
+    """Records the DJ process's PID in DJ_PID_FILE."""
+    try:
+        os.makedirs(os.path.dirname(DJ_PID_FILE), exist_ok=True)
+        with open(DJ_PID_FILE, 'w') as f:
+            f.write(str(pid))
+    except OSError as e:
+        print(f"Could not write PID file: {e}")
+
+def remove_pid_file(pid):
+    """Deletes DJ_PID_FILE if it still belongs to pid (a newer DJ may have replaced it)."""
+    try:
+        with open(DJ_PID_FILE) as f:
+            if f.read().strip() != str(pid):
+                return
+        os.remove(DJ_PID_FILE)
+    except OSError:
+        pass
+
+def utf8_to_nsstring(data):
+    """Makes an NSString straight from UTF-8 bytes, skipping the decode to a Python str."""
+    string = NSString.alloc().initWithBytes_length_encoding_(data, len(data), NSUTF8StringEncoding)
+    if string is None:
+        # Cocoa rejects invalid UTF-8 outright; let Python substitute the bad bytes instead
+        string = data.decode('utf-8', 'replace')
+    return string
 
 class ConsoleWindow(NSObject):
     """A proper console window with scrollable text, auto-refresh, and delegate handling."""
@@ -25,7 +98,13 @@ class ConsoleWindow(NSObject):
             self.title = title
             self.console_window = None
             self.text_view = None
-            self.timer = None
+            self._update_pending = False  # Set while an update is queued on the main thread
+            self._text_attributes = None
+            # What text_view currently shows: the runner's output generation, how many of its
+            # bytes have been appended so far, and roughly how many bytes the view holds
+            self._shown_generation = -1
+            self._bytes_shown = 0
+            self._bytes_in_view = 0
         return self
     
     def show(self):
@@ -53,36 +132,48 @@ class ConsoleWindow(NSObject):
         scroll_view.setHasVerticalScroller_(True)
         scroll_view.setAutoresizingMask_(NSViewWidthSizable | NSViewHeightSizable)
         
-        self.text_view = NSTextView.alloc().initWithFrame_(scroll_view.bounds())
+        frame = scroll_view.bounds()
+        if hasattr(NSTextView, 'textViewUsingTextLayoutManager_'):
+            # TextKit 2 (macOS 12+) only lays out the lines in view, however long the log gets
+            self.text_view = NSTextView.textViewUsingTextLayoutManager_(True)
+            self.text_view.setFrame_(frame)
+        else:
+            self.text_view = NSTextView.alloc().initWithFrame_(frame)
+        self.text_view.setMinSize_(NSMakeSize(0, frame.size.height))
+        self.text_view.setMaxSize_(NSMakeSize(1e7, 1e7))
+        self.text_view.setVerticallyResizable_(True)
+        self.text_view.setAutoresizingMask_(NSViewWidthSizable)
         self.text_view.setEditable_(False)
-        self.text_view.setFont_(NSFont.fontWithName_size_("Menlo", 11.0) or NSFont.userFixedPitchFontOfSize_(11.0))
+        font = NSFont.fontWithName_size_("Menlo", 11.0) or NSFont.userFixedPitchFontOfSize_(11.0)
+        self.text_view.setFont_(font)
+        # Appended text doesn't pick up the view's font, so it carries the same attributes explicitly
+        self._text_attributes = {NSFontAttributeName: font, NSForegroundColorAttributeName: NSColor.textColor()}
         
         scroll_view.setDocumentView_(self.text_view)
         self.console_window.contentView().addSubview_(scroll_view)
         
-        # Start the timer when the window is created
-        self._start_timer()
+        # Refresh whenever the runner reports new output instead of polling on a timer,
+        # so an idle DJ process costs the main thread nothing
+        self.process_runner.output_listener = self.output_changed
         self.update_content() # Call the Python method directly for the initial update
     
-    def _start_timer(self):
-        """Starts a Cocoa NSTimer that is managed by the main run loop."""
-        if self.timer:
-            self.timer.invalidate()
-        
-        # <<< THE KEY FIX IS HERE >>>
-        # We tell the timer to call a simple method name.
-        self.timer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(
-            1.0,
-            self,
-            'timerFired:', # Use a standard Objective-C method name
-            None,
-            True
-        )
+    def output_changed(self):
+        """Called from the runner's reader thread; queues one update on the main thread."""
+        if self._update_pending:
+            return
+        self._update_pending = True
+        self.performSelectorOnMainThread_withObject_waitUntilDone_('outputArrived:', None, False)
+
+    # --- Main thread side of output_changed ---
+    def outputArrived_(self, _):
+        """This Objective-C compatible stub is performed on the main thread."""
+        # Wait a moment before updating so a burst of lines is laid out in one append
+        self.performSelector_withObject_afterDelay_('flushOutput:', None, CONSOLE_FLUSH_INTERVAL)
 
-    # --- This is our timer callback method ---
-    def timerFired_(self, timer):
-        """This Objective-C compatible stub is called by NSTimer."""
-        # It immediately calls our pure Python method.
+    def flushOutput_(self, _):
+        """Appends everything that arrived since outputArrived_ in one update."""
+        # Clear the flag first so output that arrives during the update queues another one
+        self._update_pending = False
         self.update_content()
         
     def update_content(self): # This is now a pure Python method
@@ -90,13 +181,41 @@ class ConsoleWindow(NSObject):
         if not self.text_view or not self.process_runner:
             return
             
-        current_text = self.text_view.string()
-        new_output = self.process_runner.get_output()
+        runner = self.process_runner
+        if runner.output_generation != self._shown_generation:
+            # The buffer was cleared for a new process, so start the view over
+            self._shown_generation = runner.output_generation
+            self._bytes_shown = 0
+            self._bytes_in_view = 0
+            self.text_view.setString_("")
+        
+        if runner.bytes_written == self._bytes_shown:
+            return # Nothing new since the last update; skip the lock and the text view entirely
+        
+        new_data, bytes_written = runner.get_new_output(self._bytes_shown)
+        
+        new_bytes = bytes_written - self._bytes_shown
+        if new_data is None or self._bytes_in_view + new_bytes > 2 * OUTPUT_BUFFER_SIZE:
+            # Output was overwritten before we showed it, or the view has grown well past the
+            # buffer: redraw it from the buffer once instead of appending
+            new_output, bytes_written, byte_count = runner.get_output_snapshot()
+            dropped = bytes_written - byte_count - self._bytes_shown
+            if new_data is None and dropped > 0:
+                # Mark the gap rather than silently skipping output that was overwritten unseen
+                new_output = f"... {dropped} bytes of output dropped ...\n".encode() + new_output
+            print(f"Updating console with {len(new_output)} bytes")
+            self.text_view.setString_(utf8_to_nsstring(new_output))
+            self._bytes_in_view = byte_count
+        else:
+            # Logs only ever grow, so append just the new lines and let Cocoa lay out only those
+            self.text_view.textStorage().appendAttributedString_(
+                NSAttributedString.alloc().initWithString_attributes_(
+                    utf8_to_nsstring(new_data), self._text_attributes)
+            )
+            self._bytes_in_view += new_bytes
         
-        if current_text != new_output:
-            print(f"Updating console with {len(new_output)} characters")
-            self.text_view.setString_(new_output)
-            self.text_view.scrollToEndOfDocument_(None) # Use None for the sender
+        self._bytes_shown = bytes_written
+        self.text_view.scrollToEndOfDocument_(None) # Use None for the sender
 
     # --- Delegate Methods (No changes here, but remove decorator) ---
     def windowShouldClose_(self, sender):
@@ -108,10 +227,10 @@ class ConsoleWindow(NSObject):
         return False
 
     def force_close(self):
-        """A method to permanently close the window and stop its timer."""
-        if self.timer:
-            self.timer.invalidate()
-            self.timer = None
+        """A method to permanently close the window and stop its updates."""
+        if self.process_runner.output_listener == self.output_changed:
+            self.process_runner.output_listener = None
+        NSObject.cancelPreviousPerformRequestsWithTarget_(self)
         
         if self.console_window:
             self.console_window.setDelegate_(None) # Unset delegate before closing
@@ -153,13 +272,29 @@ class ProcessRunner:
         self.script_name = script_name
         self.args = args
         self.process = None
-        self.output_buffer = []
-        self.max_buffer_lines = 1000  # Keep last 1000 lines
+        # Output is kept as newline-terminated UTF-8 lines in a fixed-size ring: _ring_head is
+        # where the next byte goes and _ring_size how many bytes of the ring hold output
+        self._ring = bytearray(OUTPUT_BUFFER_SIZE)
+        self._ring_head = 0
+        self._ring_size = 0
+        # output_version is bumped on every change to the ring, so get_output_snapshot only
+        # re-reads it when something was actually added
+        self._output_lock = threading.Lock()
+        self.output_version = 0
+        self._cached_output = b''
+        self._cached_version = 0
+        self.bytes_written = 0  # Bytes appended since the ring was last cleared
+        self.output_generation = 0  # Bumped whenever the ring is cleared
+        self.output_listener = None  # Called (from the reader thread) whenever the output changes
+        self.exit_listener = None  # Called (from the reader thread) once the process has exited
+        # "[HH:MM:SS] " prefix for output lines, re-formatted only when the second changes
+        self._timestamp_second = None
+        self._timestamp_prefix = ''
 
     def start(self):
         if not self.is_running():
-            script_path = os.path.join(os.path.dirname(__file__), self.script_name)
-            if not os.path.exists(script_path):
+            script_path = DJ_SCRIPTS.get(self.script_name)
+            if script_path is None or self.script_name in MISSING_DJ_SCRIPTS:
                 rumps.alert(f"Error: Script not found!", f"The script '{self.script_name}' was not found.")
                 return False
             
@@ -168,20 +303,26 @@ class ProcessRunner:
             print(f"Starting process: {' '.join(command)}")
             
             # Clear output buffer
-            self.output_buffer = []
+            with self._output_lock:
+                self._ring_head = 0
+                self._ring_size = 0
+                self.output_version += 1
+                self.bytes_written = 0
+                self.output_generation += 1
+            self._notify_output()
             
             # Start the process in a new process group and capture output
             self.process = subprocess.Popen(
                 command,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,  # Combine stderr with stdout
-                universal_newlines=True,
-                bufsize=1,  # Line buffered
+                bufsize=0,  # Raw pipe; _read_output reads it in blocks and splits lines itself
                 preexec_fn=os.setsid if hasattr(os, 'setsid') else None
             )
             
+            write_pid_file(self.process.pid)
+            
             # Start a thread to read output continuously
-            import threading
             self.output_thread = threading.Thread(target=self._read_output, daemon=True)
             self.output_thread.start()
             
@@ -191,25 +332,31 @@ class ProcessRunner:
     def stop(self):
         if self.is_running():
             print("Stopping process...")
+            process = self.process
             try:
-                # Try to terminate the entire process group
-                if hasattr(os, 'killpg'):
-                    os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+                # The DJ runs in its own process group, so one signal reaches anything it spawned
+                pgid = os.getpgid(process.pid) if hasattr(os, 'killpg') else None
+                if pgid is not None:
+                    os.killpg(pgid, signal.SIGTERM)
                 else:
-                    self.process.terminate()
-                    
-                # Wait for the process to finish
-                self.process.wait(timeout=5)
-            except (OSError, subprocess.TimeoutExpired):
-                # Force kill if it doesn't terminate gracefully
-                try:
-                    if hasattr(os, 'killpg'):
-                        os.killpg(os.getpgid(self.process.pid), signal.SIGKILL)
+                    process.terminate()
+                
+                # Check back every STOP_POLL_INTERVAL instead of blocking for the whole grace period
+                deadline = time.monotonic() + STOP_GRACE_PERIOD
+                while process.poll() is None and time.monotonic() < deadline:
+                    time.sleep(STOP_POLL_INTERVAL)
+                
+                if process.poll() is None:
+                    # Force kill if it doesn't terminate gracefully
+                    if pgid is not None:
+                        os.killpg(pgid, signal.SIGKILL)
                     else:
-                        self.process.kill()
-                except OSError:
-                    pass
+                        process.kill()
+                    process.wait()
+            except OSError:
+                pass # Already gone
                     
+            remove_pid_file(process.pid)
             self.process = None
             return True
         return False
@@ -219,29 +366,138 @@ class ProcessRunner:
     
     def _read_output(self):
         """Read output from the subprocess in a separate thread."""
-        if not self.process or not self.process.stdout:
+        process = self.process
+        if not process or not process.stdout:
             return
             
+        kq = None
         try:
-            while self.process and self.process.poll() is None:
-                line = self.process.stdout.readline()
-                if line:
-                    # Add timestamp and store in buffer
-                    import time
-                    timestamp = time.strftime('%H:%M:%S')
-                    formatted_line = f"[{timestamp}] {line.rstrip()}"
-                    self.output_buffer.append(formatted_line)
-                    
-                    # Keep buffer size manageable
-                    if len(self.output_buffer) > self.max_buffer_lines:
-                        self.output_buffer.pop(0)
+            fd = process.stdout.fileno()
+            os.set_blocking(fd, False)
+            if hasattr(select, 'kqueue'):
+                # One kqueue wait covers both new output and the process exiting, so there's
+                # no timeout to poll on and no window between checking for exit and reading
+                kq = select.kqueue()
+                kq.control([select.kevent(fd, select.KQ_FILTER_READ, select.KQ_EV_ADD)], 0)
+                try:
+                    kq.control([select.kevent(process.pid, select.KQ_FILTER_PROC, select.KQ_EV_ADD,
+                                              select.KQ_NOTE_EXIT)], 0)
+                except ProcessLookupError:
+                    pass # Already exited; the read filter still sees EOF
+            
+            partial = b''  # Incomplete last line, finished by the next read
+            while True:
+                if kq is not None:
+                    events = kq.control(None, 2)
+                    exited = any(event.filter == select.KQ_FILTER_PROC for event in events)
+                else:
+                    ready, _, _ = select.select([fd], [], [], 1.0)
+                    if not ready:
+                        if process.poll() is not None:
+                            break
+                        continue
+                    exited = False
+                
+                # Drain everything that's buffered, so an exit event doesn't lose the last output
+                eof = False
+                while True:
+                    try:
+                        data = os.read(fd, OUTPUT_READ_SIZE)
+                    except BlockingIOError:
+                        break
+                    if not data:
+                        eof = True # The process closed its output
+                        break
+                    lines = (partial + data).split(b'\n')
+                    partial = lines.pop()
+                    if lines:
+                        self._append_lines(lines)
+                if eof or exited:
+                    break
+            
+            if partial:
+                self._append_lines([partial])
+            
+            # Output is closed, so the process is exiting; a blocking wait costs no wakeups
+            process.wait()
+            remove_pid_file(process.pid)
                         
         except Exception as e:
             print(f"Error reading output: {e}")
+        finally:
+            if kq is not None:
+                kq.close()
+            listener = self.exit_listener
+            if listener:
+                listener()
+    
+    def _append_lines(self, lines):
+        """Timestamps raw output lines and adds them to the buffer."""
+        now = int(time.time())
+        if now != self._timestamp_second:
+            self._timestamp_second = now
+            self._timestamp_prefix = time.strftime('[%H:%M:%S] ', time.localtime(now))
+        prefix = self._timestamp_prefix.encode()
+        data = b''.join(prefix + line.rstrip() + b'\n' for line in lines)
+        with self._output_lock:
+            self._write_ring(data)
+            self.output_version += 1
+            self.bytes_written += len(data)
+        self._notify_output()
+    
+    def _write_ring(self, data):
+        """Copies data into the ring, overwriting the oldest output. Call with _output_lock held."""
+        ring = self._ring
+        capacity = len(ring)
+        if len(data) > capacity:
+            data = data[-capacity:]
+        length = len(data)
+        first = min(length, capacity - self._ring_head)
+        ring[self._ring_head:self._ring_head + first] = data[:first]
+        ring[:length - first] = data[first:] # Wraps around to the start
+        self._ring_head = (self._ring_head + length) % capacity
+        self._ring_size = min(self._ring_size + length, capacity)
+    
+    def _read_ring(self, length):
+        """Returns the newest `length` bytes of the ring. Call with _output_lock held."""
+        ring = self._ring
+        start = (self._ring_head - length) % len(ring)
+        if start + length <= len(ring):
+            return bytes(ring[start:start + length])
+        return bytes(ring[start:]) + bytes(ring[:self._ring_head])
             
+    def _notify_output(self):
+        listener = self.output_listener
+        if listener:
+            listener()
+    
+    def get_new_output(self, since):
+        """Returns (UTF-8 output appended after the first `since` bytes, bytes_written).
+
+        The output is None if some of it has already been overwritten in the ring, or if the
+        ring was cleared since `since` was read.
+        """
+        with self._output_lock:
+            length = self.bytes_written - since
+            if length < 0 or length > self._ring_size:  # Negative if the ring was just cleared
+                return None, self.bytes_written
+            return self._read_ring(length), self.bytes_written
+    
+    def get_output_snapshot(self):
+        """Returns (UTF-8 output, bytes_written, bytes in the output), taken together under the lock."""
+        with self._output_lock:
+            if self._cached_version != self.output_version:
+                data = self._read_ring(self._ring_size)
+                if self.bytes_written > self._ring_size:
+                    # The oldest line was partly overwritten, so start at the next whole one
+                    data = data[data.find(b'\n') + 1:]
+                self._cached_output = data
+                self._cached_version = self.output_version
+            return self._cached_output, self.bytes_written, len(self._cached_output)
+    
     def get_output(self):
         """Get the current output buffer as a string."""
-        return '\n'.join(self.output_buffer)
+        return self.get_output_snapshot()[0].decode('utf-8', 'replace')
 
 class InfiniteRadioApp(rumps.App):
     def __init__(self):
@@ -255,6 +511,15 @@ class InfiniteRadioApp(rumps.App):
         self.interval = 10  # Default interval in seconds
         self.console_window_controller = None  # Renamed for clarity
         
+        # Drop the cached monitor list whenever displays change
+        self.screen_observer = ScreenChangeObserver.alloc().init()
+        NSNotificationCenter.defaultCenter().addObserver_selector_name_object_(
+            self.screen_observer, 'screenParametersChanged:', NSApplicationDidChangeScreenParametersNotification, None
+        )
+        
+        for name in sorted(MISSING_DJ_SCRIPTS):
+            print(f"Warning: DJ script not found: {DJ_SCRIPTS[name]}")
+        
         # Clean up any orphaned DJ processes from previous runs
         self.cleanup_orphaned_processes()
         
@@ -265,59 +530,71 @@ class InfiniteRadioApp(rumps.App):
         
         self.rebuild_menu()
         
-        self.status_updater = rumps.Timer(self.update_status, 1)
-        self.status_updater.start()
+        # The Start/Stop title is updated when the DJ is started or stopped from the menu, and
+        # from the runner's reader thread if the process exits on its own; no polling timer
+        self.dj_runner.exit_listener = lambda: AppHelper.callAfter(self.update_status, None)
 
     def cleanup_orphaned_processes(self):
         """
-        Clean up any orphaned DJ processes from previous app runs.
+        Clean up a DJ process left running by a previous app run.
         This is especially important after macOS permission prompts that kill and restart the app.
         """
         try:
-            import psutil
-            
-            killed_processes = []
-            
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                try:
-                    cmdline = proc.info['cmdline']
-                    if not cmdline:
-                        continue
-                        
-                    cmdline_str = ' '.join(cmdline)
-                    
-                    # Look for our DJ scripts
-                    if ('llm_dj.py' in cmdline_str or 'process_dj.py' in cmdline_str):
-                        # Make sure it's not the current process
-                        if proc.pid != os.getpid():
-                            print(f"Found orphaned DJ process: PID {proc.pid} - {cmdline_str}")
-                            proc.terminate()
-                            killed_processes.append(f"PID {proc.pid}")
-                            
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    continue
-                    
-            if killed_processes:
-                print(f"Cleaned up orphaned processes: {', '.join(killed_processes)}")
+            with open(DJ_PID_FILE) as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            print("No orphaned DJ processes found")
+            return
+        
+        try:
+            os.kill(pid, 0)  # Raises if the process is gone
+            # The PID may have been reused since, so check it's still one of our scripts
+            cmdline = psutil.Process(pid).cmdline()
+            if pid != os.getpid() and any(script in arg for arg in cmdline for script in DJ_SCRIPTS):
+                print(f"Found orphaned DJ process: PID {pid} - {' '.join(cmdline)}")
+                # The DJ was started in its own session, so this also stops anything it spawned
+                os.killpg(os.getpgid(pid), signal.SIGTERM)
+                print(f"Cleaned up orphaned processes: PID {pid}")
             else:
                 print("No orphaned DJ processes found")
-                
+        except (OSError, psutil.Error):
+            print("No orphaned DJ processes found")
         except Exception as e:
             print(f"Error during cleanup: {e}")
+        finally:
+            remove_pid_file(pid)
+
+    def _setting_titles(self):
+        """Titles of the menu items that display the current settings."""
+        # Display current settings or "Not Set"
+        display_dj_type = "Process DJ" if self.dj_type == "process" else "LLM DJ"
+        titles = {
+            "dj_type": f"Current: {display_dj_type}",
+            "ip": f"IP: {self.ip or 'Not Set'}",
+            "port": f"Port: {self.port or 'Not Set'}",
+            "model": f"Model: {self.model_name or 'Not Set'}",
+            "interval": f"Interval: {self.interval}s",
+        }
+        if self.dj_type == "llm":
+            titles["monitor"] = f"Monitor: {self._get_monitor_description()}"
+        return titles
 
     def rebuild_menu(self):
-        """Clears and rebuilds the menu to reflect the current state."""
+        """Clears and rebuilds the menu to reflect the current state.
+
+        Only needed when the menu's structure changes (the DJ type decides whether the monitor
+        rows exist); settings changes just retitle the existing items via refresh_display.
+        """
         self.menu.clear()
         
-        # Display current settings or "Not Set"
-        display_ip = self.ip or "Not Set"
-        display_port = self.port or "Not Set"
         display_dj_type = "Process DJ" if self.dj_type == "process" else "LLM DJ"
-        display_model = self.model_name or "Not Set"
-        display_monitor = self._get_monitor_description()
-        display_interval = f"{self.interval}s"
-        
         is_configured = self.ip is not None and self.port is not None
+        
+        # Items showing the current settings, kept so refresh_display can retitle them
+        self.setting_items = {
+            key: rumps.MenuItem(title, callback=None) for key, title in self._setting_titles().items()
+        }
+        items = self.setting_items
 
         # Create menu items
         dj_title = f"Start {display_dj_type}"
@@ -338,7 +615,7 @@ class InfiniteRadioApp(rumps.App):
                     rumps.MenuItem("Process DJ", callback=self.set_process_dj),
                     rumps.MenuItem("LLM DJ", callback=self.set_llm_dj),
                     rumps.separator,
-                    rumps.MenuItem(f"Current: {display_dj_type}", callback=None),
+                    items["dj_type"],
                 ]
             },
             {
@@ -348,11 +625,11 @@ class InfiniteRadioApp(rumps.App):
                     rumps.MenuItem("Configure Monitor", callback=self.configure_monitor) if self.dj_type == "llm" else None,
                     rumps.MenuItem("Configure Interval", callback=self.configure_interval),
                     rumps.separator,
-                    rumps.MenuItem(f"IP: {display_ip}", callback=None),
-                    rumps.MenuItem(f"Port: {display_port}", callback=None),
-                    rumps.MenuItem(f"Model: {display_model}", callback=None),
-                    rumps.MenuItem(f"Monitor: {display_monitor}", callback=None) if self.dj_type == "llm" else None,
-                    rumps.MenuItem(f"Interval: {display_interval}", callback=None),
+                    items["ip"],
+                    items["port"],
+                    items["model"],
+                    items["monitor"] if self.dj_type == "llm" else None,
+                    items["interval"],
                 ]
             },
             rumps.separator,
@@ -365,8 +642,19 @@ class InfiniteRadioApp(rumps.App):
         
         self.update_status(None)
 
+    def refresh_display(self):
+        """Updates the menu in place after a settings change that doesn't alter its structure."""
+        for key, title in self._setting_titles().items():
+            self.setting_items[key].title = title
+        
+        # The Start and Open UI items only work once the server is configured
+        is_configured = self.ip is not None and self.port is not None
+        self.start_dj_item.set_callback(self.toggle_dj_process if is_configured else None)
+        self.open_ui_item.set_callback(self.open_ui if is_configured else None)
+        self.update_status(None)
+
     def update_status(self, _):
-        """Timer callback to update the 'Start/Stop' button title."""
+        """Updates the 'Start/Stop' button title."""
         is_configured = self.ip is not None and self.port is not None
         if not is_configured:
             return # Don't update if not configured
@@ -481,31 +769,28 @@ class InfiniteRadioApp(rumps.App):
     
     def _get_monitor_description(self):
         """Get a human-readable description of the current monitor selection."""
+        if self.monitor_index == 0:
+            return "All monitors"
         try:
-            import mss
-            with mss.mss() as sct:
-                if self.monitor_index == 0:
-                    return "All monitors"
-                elif self.monitor_index < len(sct.monitors):
-                    monitor = sct.monitors[self.monitor_index]
-                    return f"Monitor {self.monitor_index} ({monitor['width']}x{monitor['height']})"
-                else:
-                    return f"Monitor {self.monitor_index} (invalid)"
+            monitors = get_monitors()
+            if self.monitor_index < len(monitors):
+                width, height = monitors[self.monitor_index]
+                return f"Monitor {self.monitor_index} ({width}x{height})"
+            else:
+                return f"Monitor {self.monitor_index} (invalid)"
         except Exception:
             return f"Monitor {self.monitor_index}"
     
     def _get_available_monitors(self):
         """Get a list of available monitors."""
         try:
-            import mss
-            with mss.mss() as sct:
-                monitors = []
-                for i, monitor in enumerate(sct.monitors):
-                    if i == 0:
-                        monitors.append(f"{i}: All monitors ({monitor['width']}x{monitor['height']})")
-                    else:
-                        monitors.append(f"{i}: Monitor {i} ({monitor['width']}x{monitor['height']})")
-                return monitors
+            monitors = []
+            for i, (width, height) in enumerate(get_monitors()):
+                if i == 0:
+                    monitors.append(f"{i}: All monitors ({width}x{height})")
+                else:
+                    monitors.append(f"{i}: Monitor {i} ({width}x{height})")
+            return monitors
         except Exception as e:
             return [f"Error: {e}"]
     
@@ -543,7 +828,7 @@ class InfiniteRadioApp(rumps.App):
             self.dj_runner.stop()
         
         self.monitor_index = new_monitor
-        self.rebuild_menu()
+        self.refresh_display()
         
         monitor_desc = self._get_monitor_description()
         rumps.notification("Monitor Updated", f"Monitor set to {monitor_desc}", "LLM DJ will capture this monitor.")
@@ -586,7 +871,7 @@ class InfiniteRadioApp(rumps.App):
             self.dj_runner.stop()
         
         self.interval = new_interval
-        self.rebuild_menu()
+        self.refresh_display()
         
         rumps.notification("Interval Updated", f"Update interval set to {self.interval} seconds", f"{dj_type_name} will check for changes every {self.interval} seconds.")
         
@@ -615,7 +900,7 @@ class InfiniteRadioApp(rumps.App):
             self.dj_runner.stop()
         
         self.model_name = new_model
-        self.rebuild_menu()
+        self.refresh_display()
         
         rumps.notification("Model Updated", f"Model set to {self.model_name}", "LLM DJ will use this model.")
         
@@ -683,8 +968,8 @@ class InfiniteRadioApp(rumps.App):
         self.ip = new_ip
         self.port = new_port
         
-        # Rebuild the menu to enable buttons and show new settings
-        self.rebuild_menu()
+        # Update the menu to enable buttons and show new settings
+        self.refresh_display()
         
         rumps.notification("Settings Applied", f"Server set to {self.ip}:{self.port}", "You can now start the DJ script.")
 
@@ -4,14 +4,25 @@ import time
 import sys
 import psutil
 import requests
+from requests.adapters import HTTPAdapter
 import argparse
 import platform
-from collections import defaultdict
+import os
+import re
+
+try:
+    import ahocorasick  # pyahocorasick: matches all genre keywords in one pass
+except ImportError:
+    ahocorasick = None
+
+# Keep-alive session for genre updates, so each change reuses the connection to the music server
+_SESSION = requests.Session()
+_SESSION.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
 
 # --- Configuration: Process Filtering ---
 
 # Processes to always ignore. This is our primary filter.
-PROCESS_BLACKLIST = {
+PROCESS_BLACKLIST = frozenset(name.lower() for name in {
     # macOS
     'kernel_task', 'launchd', 'cfprefsd', 'logd', 'UserEventAgent', 'runningboardd',
     'CommCenter', 'SpringBoard', 'backboardd', 'ReportCrash', 'spindump', 'WindowServer',
@@ -30,37 +41,18 @@ PROCESS_BLACKLIST = {
     'system', 'registry', 'smss.exe', 'csrss.exe', 'wininit.exe', 'winlogon.exe',
     'services.exe', 'lsass.exe', 'svchost.exe', 'dwm.exe', 'explorer.exe',
     'sihost.exe', 'ctfmon.exe', 'fontdrvhost.exe', 'audiodg.exe', 'RuntimeBroker.exe',
-}
+})  # Lowercased, and matched against lowercased process names
 
-def is_script_process(cmdline):
-    """Check if a process is running this script"""
-    if not cmdline:
-        return False
-    cmdline_str = ' '.join(cmdline)
-    script_names = ['process_dj.py', 'top_process_dj.py', 'process_dj_refined.py']
-    return any(script_name in cmdline_str for script_name in script_names)
+# Interpreter names that may be running this script
+PYTHON_NAMES = frozenset({'python', 'python3', 'python.exe', 'python3.exe'})
 
-def map_process_to_genre(process_name, cmdline_str=""):
-    """Maps a process name to a music genre. Now includes cmdline for better context."""
-    p_name = process_name.lower().replace('.exe', '')
-    cmdline_lower = cmdline_str.lower()
-    
-    # Debug output to see what we're working with
-    print(f"   DEBUG: Processing '{process_name}' -> '{p_name}'")
+# --- Configuration: Process -> Genre Mapping ---
 
-    # More reliable mapping for Mac apps running under generic names like 'Electron'
-    if 'electron' in p_name:
-        if 'visual studio code.app' in cmdline_lower: p_name = 'vscode'
-        elif 'obsidian.app' in cmdline_lower: p_name = 'obsidian'
-        elif 'slack.app' in cmdline_lower: p_name = 'slack'
-        elif 'discord.app' in cmdline_lower: p_name = 'discord'
-        elif 'whatsapp.app' in cmdline_lower: p_name = 'whatsapp'
-        elif 'figma.app' in cmdline_lower: p_name = 'figma'
-        elif 'notion.app' in cmdline_lower: p_name = 'notion'
-        elif 'spotify.app' in cmdline_lower: p_name = 'spotify'
-
-    # Gaming - check if any game keyword is in the process name
-    gaming_keywords = [
+# Keyword categories in priority order: a process gets the genre of the first category with a
+# keyword in its lowercased name.
+GENRE_CATEGORIES = (
+    # Gaming
+    ('gaming', "epic orchestral", (
         'steam', 'lutris', 'csgo', 'dota2', 'valorant', 'league of legends', 'fortnite',
         'minecraft', 'overwatch', 'apex legends', 'rocket league', 'cyberpunk2077',
         'elden ring', 'witcher3', 'gta', 'fifa', 'nba2k', 'call of duty', 'battlefield',
@@ -69,15 +61,10 @@ def map_process_to_genre(process_name, cmdline_str=""):
         'wow', 'lol', 'dota', 'pubg', 'among us', 'fall guys', 'rust', 'ark', 'terraria',
         'stardew valley', 'cities skylines', 'civilization', 'total war', 'age of empires',
         'counter-strike', 'rainbow six', 'sea of thieves', 'no mans sky', 'subnautica',
-        'epic games', 'origin', 'uplay', 'battle.net', 'gog galaxy', 'gamepass'
-    ]
-    for keyword in gaming_keywords:
-        if keyword in p_name:
-            print(f"   DEBUG: Matched gaming keyword '{keyword}' -> epic orchestral")
-            return "epic orchestral"
-    
+        'epic games', 'origin', 'uplay', 'battle.net', 'gog galaxy', 'gamepass',
+    )),
     # Development & Programming
-    dev_keywords = [
+    ('development', "lofi hip hop", (
         'code', 'vscode', 'cursor', 'pycharm', 'intellij', 'webstorm', 'phpstorm', 'clion', 'datagrip',
         'vim', 'nvim', 'neovim', 'emacs', 'sublime text', 'atom', 'brackets', 'notepad++',
         'xcode', 'android studio', 'unity', 'unreal engine', 'godot', 'blender',
@@ -88,232 +75,339 @@ def map_process_to_genre(process_name, cmdline_str=""):
         'redis-cli', 'mongodb compass', 'elasticsearch', 'kibana', 'grafana',
         'jupyter', 'anaconda', 'spyder', 'rstudio', 'matlab', 'octave',
         'node', 'npm', 'yarn', 'python', 'ruby', 'php', 'java', 'golang', 'rustc',
-        'wireshark', 'burp suite', 'metasploit', 'nmap', 'sqlmap'
-    ]
-    for keyword in dev_keywords:
-        if keyword in p_name:
-            print(f"   DEBUG: Matched development keyword '{keyword}' -> lofi hip hop")
-            return "lofi hip hop"
-    
+        'wireshark', 'burp suite', 'metasploit', 'nmap', 'sqlmap',
+    )),
     # Web Browsing
-    browser_keywords = [
+    ('browser', "synthwave", (
         'chrome', 'firefox', 'safari', 'edge', 'brave', 'opera', 'vivaldi',
         'chromium', 'tor browser', 'librewolf', 'waterfox', 'seamonkey',
-        'internet explorer', 'ie', 'msedge'
-    ]
-    for keyword in browser_keywords:
-        if keyword in p_name:
-            print(f"   DEBUG: Matched browser keyword '{keyword}' -> synthwave")
-            return "synthwave"
-    
+        'internet explorer', 'ie', 'msedge',
+    )),
     # Media & Entertainment
-    media_keywords = [
+    ('media', "chillwave", (
         'spotify', 'apple music', 'youtube music', 'pandora', 'soundcloud',
         'vlc', 'mpv', 'quicktime', 'windows media player', 'media player classic',
         'kodi', 'plex', 'jellyfin', 'emby', 'netflix', 'hulu', 'disney+',
         'youtube', 'twitch', 'obs', 'streamlabs', 'xsplit', 'restream',
         'audacity', 'garage band', 'logic pro', 'ableton live', 'fl studio',
-        'cubase', 'pro tools', 'reaper', 'reason', 'bitwig', 'studio one'
-    ]
-    if any(keyword in p_name for keyword in media_keywords):
-        print(f"   DEBUG: Matched media -> chillwave")
-        return "chillwave"
-    
+        'cubase', 'pro tools', 'reaper', 'reason', 'bitwig', 'studio one',
+    )),
     # Communication & Social
-    comm_keywords = [
+    ('communication', "upbeat pop", (
         'discord', 'slack', 'teams', 'zoom', 'skype', 'webex', 'gotomeeting',
         'telegram', 'whatsapp', 'signal', 'messenger', 'imessage', 'facetime',
         'thunderbird', 'outlook', 'mail', 'gmail', 'yahoo mail', 'protonmail',
         'tweetdeck', 'twitter', 'facebook', 'instagram', 'linkedin', 'reddit',
-        'mastodon', 'matrix', 'element', 'riot', 'irc', 'hexchat', 'weechat'
-    ]
-    if any(keyword in p_name for keyword in comm_keywords):
-        print(f"   DEBUG: Matched communication -> upbeat pop")
-        return "upbeat pop"
-    
+        'mastodon', 'matrix', 'element', 'riot', 'irc', 'hexchat', 'weechat',
+    )),
     # Terminals & Command Line
-    terminal_keywords = [
+    ('terminal', "chiptune", (
         'terminal', 'iterm', 'alacritty', 'kitty', 'konsole', 'gnome-terminal',
         'xterm', 'urxvt', 'terminator', 'tilix', 'hyper', 'warp', 'tabby',
         'powershell', 'cmd', 'bash', 'zsh', 'fish', 'tmux', 'screen',
-        'windows terminal', 'wt', 'pwsh'
-    ]
-    if any(keyword in p_name for keyword in terminal_keywords):
-        print(f"   DEBUG: Matched terminal -> chiptune")
-        return "chiptune"
-    
-    # Office & Productivity
-    office_keywords = [
-        'word', 'excel', 'powerpoint', 'outlook', 'onenote', 'access', 'publisher',
+        'windows terminal', 'wt', 'pwsh',
+    )),
+    # Office & Productivity (outlook is matched as communication)
+    ('office', "jazz", (
+        'word', 'excel', 'powerpoint', 'onenote', 'access', 'publisher',
         'libreoffice', 'openoffice', 'writer', 'calc', 'impress', 'draw', 'base',
         'google docs', 'google sheets', 'google slides', 'google drive',
         'notion', 'obsidian', 'logseq', 'roam research', 'remnote', 'anki',
-        'evernote', 'onenote', 'bear', 'drafts', 'ulysses', 'scrivener',
+        'evernote', 'bear', 'drafts', 'ulysses', 'scrivener',
         'trello', 'asana', 'monday', 'clickup', 'todoist', 'things', 'omnifocus',
-        'calendly', 'fantastical', 'calendar', 'reminders', 'notes'
-    ]
-    if any(keyword in p_name for keyword in office_keywords):
-        print(f"   DEBUG: Matched office -> jazz")
-        return "jazz"
-    
+        'calendly', 'fantastical', 'calendar', 'reminders', 'notes',
+    )),
     # Design & Creative
-    design_keywords = [
+    ('design', "ambient", (
         'photoshop', 'illustrator', 'indesign', 'after effects', 'premiere pro',
         'lightroom', 'bridge', 'acrobat', 'xd', 'dimension', 'animate',
         'figma', 'sketch', 'canva', 'affinity photo', 'affinity designer',
         'affinity publisher', 'pixelmator', 'gimp', 'inkscape', 'krita',
         'procreate', 'clip studio paint', 'paint tool sai', 'artrage',
         'zbrush', 'maya', '3ds max', 'cinema 4d', 'houdini', 'substance painter',
-        'substance designer', 'marmoset toolbag', 'keyshot', 'vray', 'octane'
-    ]
-    if any(keyword in p_name for keyword in design_keywords):
-        print(f"   DEBUG: Matched design -> ambient")
-        return "ambient"
-    
-    # Video & Audio Editing
-    video_keywords = [
-        'final cut pro', 'davinci resolve', 'premiere pro', 'after effects',
+        'substance designer', 'marmoset toolbag', 'keyshot', 'vray', 'octane',
+    )),
+    # Video & Audio Editing (premiere pro and after effects are matched as design; vlc, audacity,
+    # logic pro, pro tools and reaper as media)
+    ('video editing', "cinematic", (
+        'final cut pro', 'davinci resolve',
         'avid media composer', 'filmora', 'camtasia', 'screenflow', 'handbrake',
-        'ffmpeg', 'vlc', 'audacity', 'logic pro', 'pro tools', 'reaper',
-        'hindenburg', 'izotope', 'waves', 'slate digital', 'universal audio'
-    ]
-    if any(keyword in p_name for keyword in video_keywords):
-        print(f"   DEBUG: Matched video editing -> cinematic")
-        return "cinematic"
-    
+        'ffmpeg',
+        'hindenburg', 'izotope', 'waves', 'slate digital', 'universal audio',
+    )),
     # File Management & System
-    file_mgr_keywords = [
+    ('file management', "minimal techno", (
         'finder', 'explorer', 'nautilus', 'dolphin', 'thunar', 'pcmanfm',
         'ranger', 'nemo', 'caja', 'spacefm', 'double commander', 'total commander',
         'far manager', 'midnight commander', 'mc', 'ftp', 'sftp', 'rsync',
         'filezilla', 'cyberduck', 'transmit', 'winscp', 'putty', 'mobaxterm',
         'activity monitor', 'task manager', 'process explorer', 'htop', 'btop',
-        'system monitor', 'resource monitor', 'performance monitor'
-    ]
-    if any(keyword in p_name for keyword in file_mgr_keywords):
-        print(f"   DEBUG: Matched file management -> minimal techno")
-        return "minimal techno"
-    
+        'system monitor', 'resource monitor', 'performance monitor',
+    )),
     # Security & VPN
-    security_keywords = [
+    ('security', "dark electronic", (
         'nordvpn', 'expressvpn', 'surfshark', 'protonvpn', 'mullvad', 'windscribe',
         'tunnelbear', 'cyberghost', 'pia', 'hotspot shield', 'openvpn', 'wireguard',
         'lastpass', 'bitwarden', '1password', 'keeper', 'dashlane', 'keychain',
         'malwarebytes', 'norton', 'mcafee', 'kaspersky', 'bitdefender', 'avast',
-        'avg', 'windows defender', 'clamav', 'sophos', 'eset'
-    ]
-    if any(keyword in p_name for keyword in security_keywords):
-        print(f"   DEBUG: Matched security -> dark electronic")
-        return "dark electronic"
-    
-    # Virtual Machines & Containers
-    vm_keywords = [
+        'avg', 'windows defender', 'clamav', 'sophos', 'eset',
+    )),
+    # Virtual Machines & Containers (docker, kubernetes and vagrant are matched as development)
+    ('virtualization', "cyberpunk", (
         'vmware', 'virtualbox', 'parallels', 'qemu', 'kvm', 'hyperv',
-        'docker', 'podman', 'containerd', 'kubernetes', 'k8s', 'minikube',
-        'vagrant', 'lxc', 'lxd', 'wine', 'crossover', 'playonlinux'
-    ]
-    if any(keyword in p_name for keyword in vm_keywords):
-        print(f"   DEBUG: Matched virtualization -> cyberpunk")
-        return "cyberpunk"
-    
-    # Database & Data Tools
-    db_keywords = [
-        'mysql', 'postgresql', 'sqlite', 'mongodb', 'redis', 'elasticsearch',
+        'podman', 'containerd', 'k8s', 'minikube',
+        'lxc', 'lxd', 'wine', 'crossover', 'playonlinux',
+    )),
+    # Database & Data Tools (elasticsearch, jupyter and rstudio are matched as development)
+    ('database', "progressive rock", (
+        'mysql', 'postgresql', 'sqlite', 'mongodb', 'redis',
         'cassandra', 'couchdb', 'influxdb', 'neo4j', 'dynamodb', 'firebase',
         'tableau', 'power bi', 'looker', 'qlik', 'superset', 'metabase',
-        'jupyter', 'rstudio', 'spss', 'sas', 'stata', 'r-studio', 'r.exe',
-        'spark', 'hadoop', 'kafka', 'airflow', 'prefect', 'dagster'
-    ]
-    if any(keyword in p_name for keyword in db_keywords):
-        print(f"   DEBUG: Matched database -> progressive rock")
-        return "progressive rock"
-    
+        'spss', 'sas', 'stata', 'r-studio', 'r.exe',
+        'spark', 'hadoop', 'kafka', 'airflow', 'prefect', 'dagster',
+    )),
     # E-commerce & Business
-    ecom_keywords = [
+    ('ecommerce', "corporate smooth jazz", (
         'shopify', 'magento', 'woocommerce', 'prestashop', 'opencart',
         'salesforce', 'hubspot', 'pipedrive', 'zoho', 'freshworks',
         'quickbooks', 'xero', 'wave', 'sage', 'tally', 'peachtree',
-        'stripe', 'paypal', 'square', 'adyen', 'klarna', 'razorpay'
-    ]
-    if any(keyword in p_name for keyword in ecom_keywords):
-        print(f"   DEBUG: Matched ecommerce -> corporate smooth jazz")
-        return "corporate smooth jazz"
-    
-    # Reading & Documentation
-    reading_keywords = [
+        'stripe', 'paypal', 'square', 'adyen', 'klarna', 'razorpay',
+    )),
+    # Reading & Documentation (notion, obsidian and logseq are matched as office)
+    ('reading', "acoustic folk", (
         'kindle', 'books', 'apple books', 'calibre', 'adobe reader', 'foxit',
         'sumatra pdf', 'evince', 'okular', 'preview', 'zathura', 'mupdf',
-        'notion', 'obsidian', 'logseq', 'roam', 'dendron', 'foam',
+        'roam', 'dendron', 'foam',
         'gitbook', 'confluence', 'wiki', 'dokuwiki', 'mediawiki',
-        'markdown', 'typora', 'mark text', 'ghostwriter', 'zettlr'
-    ]
-    if any(keyword in p_name for keyword in reading_keywords):
-        print(f"   DEBUG: Matched reading -> acoustic folk")
-        return "acoustic folk"
+        'markdown', 'typora', 'mark text', 'ghostwriter', 'zettlr',
+    )),
+)
+DEFAULT_GENRE = "lofi hip hop"  # A good, neutral default
+
+# Apps that run under a generic 'Electron' process name, by their lowercased .app bundle name
+ELECTRON_APPS = {
+    'visual studio code.app': 'vscode',
+    'obsidian.app': 'obsidian',
+    'slack.app': 'slack',
+    'discord.app': 'discord',
+    'whatsapp.app': 'whatsapp',
+    'figma.app': 'figma',
+    'notion.app': 'notion',
+    'spotify.app': 'spotify',
+}
+# The first .app bundle in a command line, e.g. 'slack.app' in '/applications/slack.app/contents/...'
+_APP_BUNDLE_RE = re.compile(r'([^/]+\.app)(?=/|\s|$)')
+
+# Every keyword mapped to the index of its category in GENRE_CATEGORIES, in priority order
+KEYWORD_PRIORITIES = {
+    keyword: priority
+    for priority, (_, _, keywords) in enumerate(GENRE_CATEGORIES)
+    for keyword in keywords
+}
+
+# File names this script has gone by
+SCRIPT_NAMES = frozenset({'process_dj.py', 'top_process_dj.py', 'process_dj_refined.py'})
+
+def is_script_process(cmdline):
+    """Check if a process is running this script"""
+    if not cmdline:
+        return False
+    # Usually 'python path/to/process_dj.py ...'; checking every argument also gets past interpreter options
+    return any(os.path.basename(arg) in SCRIPT_NAMES for arg in cmdline[1:])
+
+def build_keyword_automaton():
+    """Builds an Aho-Corasick automaton finding every GENRE_CATEGORIES keyword in one pass."""
+    automaton = ahocorasick.Automaton()
+    for keyword, priority in KEYWORD_PRIORITIES.items():
+        automaton.add_word(keyword, (priority, keyword))
+    automaton.make_automaton()
+    return automaton
+
+KEYWORD_AUTOMATON = build_keyword_automaton() if ahocorasick else None
+
+def match_category(p_name):
+    """Returns (category, genre, keyword) for the highest priority category matching p_name, or None."""
+    if KEYWORD_AUTOMATON is not None:
+        best = min((match for _, match in KEYWORD_AUTOMATON.iter(p_name)), default=None)
+        if best is None:
+            return None
+        priority, keyword = best
+        category, genre, _ = GENRE_CATEGORIES[priority]
+        return category, genre, keyword
+
+    # The keywords are in priority order, so the first one found wins
+    for keyword, priority in KEYWORD_PRIORITIES.items():
+        if keyword in p_name:
+            category, genre, _ = GENRE_CATEGORIES[priority]
+            return category, genre, keyword
+    return None
+
+def map_process_to_genre(process_name, cmdline_str="", debug=False):
+    """Maps a process name to a music genre. Now includes cmdline for better context."""
+    p_name = process_name.lower().replace('.exe', '')
+    cmdline_lower = cmdline_str.lower()
+    
+    # Debug output to see what we're working with
+    if debug:
+        print(f"   DEBUG: Processing '{process_name}' -> '{p_name}'")
+
+    # More reliable mapping for Mac apps running under generic names like 'Electron'
+    if 'electron' in p_name:
+        bundle = _APP_BUNDLE_RE.search(cmdline_lower)
+        if bundle:
+            p_name = ELECTRON_APPS.get(bundle.group(1), p_name)
+
+    match = match_category(p_name)
+    if match:
+        category, genre, keyword = match
+        if debug:
+            print(f"   DEBUG: Matched {category} keyword '{keyword}' -> {genre}")
+        return genre
+
+    if debug:
+        print(f"   DEBUG: No match found, using default -> {DEFAULT_GENRE}")
+    return DEFAULT_GENRE
+
+# On Linux, processes are read straight from /proc: one stat file per process, with the cmdline
+# only read for processes using CPU. psutil reads several files per process for the same fields.
+USE_PROC_SCAN = platform.system() == 'Linux'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if USE_PROC_SCAN else None
+
+# CPU ticks of each process at the previous /proc scan, keyed by (pid, start time) so a reused
+# PID starts over, plus the time of that scan
+_prev_cpu_ticks = {}
+_prev_scan_time = None
 
-    print(f"   DEBUG: No match found, using default -> lofi hip hop")
-    return "lofi hip hop"  # A good, neutral default
+def read_proc_cmdline(pid):
+    """Returns the command line of a process from /proc as a list of arguments."""
+    with open(f'/proc/{pid}/cmdline', 'rb') as f:
+        args = f.read().split(b'\0')
+    if args and not args[-1]:
+        args.pop() # The command line ends with a NUL
+    return [os.fsdecode(arg) for arg in args]
 
-def get_process_name_map():
+def _scan_proc_linux():
+    """Yields the process info scan_processes() describes, from /proc."""
+    global _prev_cpu_ticks, _prev_scan_time
+    now = time.monotonic()
+    elapsed = now - _prev_scan_time if _prev_scan_time is not None else None
+    cpu_ticks = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            try:
+                with open(f'/proc/{pid}/stat', 'rb') as f:
+                    stat = f.read()
+                # The name is in parentheses and may itself contain spaces or parentheses
+                head, _, rest = stat.rpartition(b')')
+                name = os.fsdecode(head.partition(b'(')[2])
+                fields = rest.split()
+                ppid = int(fields[1])
+                ticks = int(fields[11]) + int(fields[12]) # utime + stime
+                key = (pid, fields[19]) # starttime
+                cpu_ticks[key] = ticks
+
+                # Like psutil's cpu_percent(), a process reads 0% until it has been seen once before
+                cpu = 0.0
+                prev_ticks = _prev_cpu_ticks.get(key)
+                if prev_ticks is not None and elapsed:
+                    cpu = (ticks - prev_ticks) / CLOCK_TICKS / elapsed * 100
+
+                cmdline = None
+                if cpu > 0 or len(name) >= 15:
+                    cmdline = read_proc_cmdline(pid)
+                    if len(name) >= 15 and cmdline:
+                        # The kernel truncates names to 15 characters; take the full one from the cmdline
+                        full_name = os.path.basename(cmdline[0])
+                        if full_name.startswith(name):
+                            name = full_name
+            except (OSError, ValueError, IndexError):
+                continue # Exited while we were reading it, or not ours to read
+            yield {'pid': pid, 'ppid': ppid, 'name': name, 'cpu_percent': cpu, 'cmdline': cmdline}
+    finally:
+        _prev_cpu_ticks = cpu_ticks
+        _prev_scan_time = now
+
+def scan_processes():
     """
-    On some OSes (macOS), helpers have generic names. This function tries to map them
-    to their parent application for more stable tracking.
-    e.g., "Google Chrome Helper" -> "Google Chrome"
+    Yields a dict of pid, ppid, name, cpu_percent (since the previous scan) and cmdline for
+    every process. On Linux, cmdline is None for processes that aren't using CPU.
     """
-    process_map = {}
-    for p in psutil.process_iter(['pid', 'name', 'ppid']):
-        try:
-            # Simple heuristic: if a helper process is found, map its PID to its parent's name
-            if 'Helper' in p.info['name'] or 'helper' in p.info['name']:
-                parent = psutil.Process(p.info['ppid'])
-                process_map[p.info['pid']] = parent.name()
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-    return process_map
+    if USE_PROC_SCAN:
+        yield from _scan_proc_linux()
+    else:
+        for p in psutil.process_iter(['pid', 'ppid', 'name', 'cpu_percent', 'cmdline']):
+            yield p.info
 
-def get_top_apps(process_map, quiet=False):
+def get_top_apps(quiet=False):
     """
     Gets a dictionary of application CPU usage, coalescing helper processes.
     This is the key to stable CPU measurement.
+    A single pass over the processes collects both the CPU usage and the names needed to
+    credit helpers to their parent application.
     """
-    app_cpu_usage = defaultdict(float)
+    app_cpu_usage = {}
     app_cmdlines = {} # Store a sample cmdline for each app for better mapping
+    blacklist = PROCESS_BLACKLIST
+    python_names = PYTHON_NAMES
+    process_names = {} # pid -> name of every process, to look up helpers' parents
+    active = [] # (name, parent pid if it's a helper, cpu, cmdline) of each candidate using CPU
 
-    for p in psutil.process_iter(['pid', 'name', 'cpu_percent', 'cmdline']):
+    for p_info in scan_processes():
         try:
-            p_info = p.info
             p_name = p_info['name']
 
             # 1. Initial Filtering
-            if not p_name or p_name in PROCESS_BLACKLIST:
+            if not p_name:
+                continue
+            # Every name is kept, since an idle parent still names its busy helpers
+            process_names[p_info['pid']] = p_name
+
+            # Most processes are idle, so rule those out before any string work
+            cpu = p_info['cpu_percent']
+            if cpu is None or cpu <= 0:
+                continue
+
+            p_name_lower = p_name.lower()
+            if p_name_lower in blacklist:
                 continue
             
             # Skip Python processes running this script
-            if p_name.lower() in ['python', 'python3', 'python.exe', 'python3.exe']:
+            if p_name_lower in python_names:
                 if is_script_process(p_info['cmdline']):
                     continue
 
-            # 2. Coalesce helper processes
-            # If this PID is in our map (e.g., it's a helper), use the parent's name
-            app_name = process_map.get(p_info['pid'], p_name)
-
-            # 3. Aggregate CPU usage - handle None values
-            cpu = p_info['cpu_percent']
-            if cpu is not None and cpu > 0:
-                app_cpu_usage[app_name] += cpu
-                # Store the command line for context, prefer parent process's cmdline
-                if app_name not in app_cmdlines:
-                    app_cmdlines[app_name] = ' '.join(p_info['cmdline']) if p_info['cmdline'] else ''
+            # On some OSes (macOS), helpers have generic names, e.g. "Google Chrome Helper".
+            # Their parent's name may not have been seen yet, so they're resolved after the scan.
+            parent_pid = p_info['ppid'] if 'Helper' in p_name or 'helper' in p_name else None
+            active.append((p_name, parent_pid, cpu, p_info['cmdline']))
 
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             continue
 
-    if not app_cpu_usage:
+    top_app_name = None
+    top_app_cpu = 0.0
+    for p_name, parent_pid, cpu, cmdline in active:
+        # 2. Coalesce helper processes under their parent's name. Interning gives every process
+        # of an app the same string object, so the dict lookups below match on identity.
+        app_name = sys.intern(process_names.get(parent_pid, p_name))
+
+        # 3. Aggregate CPU usage, tracking the top application as we go
+        app_cpu = app_cpu_usage.get(app_name, 0.0) + cpu
+        app_cpu_usage[app_name] = app_cpu
+        if app_cpu > top_app_cpu:
+            top_app_name = app_name
+            top_app_cpu = app_cpu
+        # Store the command line for context; only the top app's is joined into a string
+        app_cmdlines.setdefault(app_name, cmdline)
+
+    if top_app_name is None:
         return None, None
 
-    # Find the top application by summed CPU usage
-    top_app_name = max(app_cpu_usage, key=app_cpu_usage.get)
-    top_app_cmdline = app_cmdlines.get(top_app_name, "")
+    top_app_cmdline = app_cmdlines[top_app_name]
+    top_app_cmdline = ' '.join(top_app_cmdline) if top_app_cmdline else ''
     
     if not quiet:
         # Debug print the top 5
@@ -331,11 +425,13 @@ def change_server_genre(server_ip, server_port, genre):
     payload = {"genre": genre}
     print(f"-> Attempting to change genre to '{genre}'...")
     try:
-        response = requests.post(url, json=payload, timeout=5)
+        response = _SESSION.post(url, json=payload, timeout=5)
         response.raise_for_status()
         print(f"   SUCCESS: Genre changed to '{response.json().get('genre', genre)}'.")
+        return True
     except requests.exceptions.RequestException as e:
         print(f"   ERROR: Could not connect to the music server at {url}. Details: {e}")
+        return False
 
 def main(args):
     """Main loop to monitor the top process and send genre changes."""
@@ -345,25 +441,28 @@ def main(args):
     print("Press Ctrl+C to stop.")
 
     last_top_app = None
+    last_genre = None
     
-    # Initialize psutil.cpu_percent. The first call is always 0.
-    for p in psutil.process_iter(['cpu_percent']):
+    # Initialize the CPU usage baseline. The first scan always reads 0.
+    for _ in scan_processes():
         pass
 
     try:
         while True:
-            # Build a map of helper processes to their parents. This is lightweight.
-            process_map = get_process_name_map()
-
             # This is where the magic happens. We get the top app after the sleep.
             # The cpu_percent values now reflect usage over the sleep interval.
-            top_app, top_app_cmdline = get_top_apps(process_map, args.quiet)
+            top_app, top_app_cmdline = get_top_apps(args.quiet)
 
             if top_app and top_app != last_top_app:
                 print(f"\nNew top application: '{top_app}'")
                 
-                new_genre = map_process_to_genre(top_app, top_app_cmdline)
-                change_server_genre(args.ip, args.port, new_genre)
+                new_genre = map_process_to_genre(top_app, top_app_cmdline, debug=not args.quiet)
+                # Different apps often share a genre (e.g. two browsers); only post actual changes
+                if new_genre != last_genre:
+                    if change_server_genre(args.ip, args.port, new_genre):
+                        last_genre = new_genre
+                elif not args.quiet:
+                    print(f"   Genre is already '{new_genre}'.")
                 
                 last_top_app = top_app
             elif not top_app and not args.quiet:
@@ -9,4 +9,5 @@ echo "Starting WebRTC server on localhost"
 docker run --rm \
     --gpus all \
     --network host \
+    --cap-add=SYS_NICE \
     musicbeats
\ No newline at end of file
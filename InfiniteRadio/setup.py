@@ -7,7 +7,7 @@ DATA_FILES = ['process_dj.py', 'llm_dj.py', 'icon.png']
 
 # Options for py2app
 OPTIONS = {
-    'packages': ['rumps', 'psutil', 'requests', 'mss', 'PIL', 'openai', 'httpx', 'ssl', 'certifi', 'Quartz'],
+    'packages': ['rumps', 'psutil', 'requests', 'mss', 'PIL', 'numpy', 'openai', 'httpx', 'ssl', 'certifi', 'Quartz'],
     
     'includes': [
         'pkg_resources._vendor.jaraco.text', 
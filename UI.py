@@ -1,4 +1,5 @@
 import sys
+from types import MappingProxyType
 # 切换到 PyQt6 库
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget,
@@ -7,19 +8,37 @@ from PyQt6.QtWidgets import (
     QScrollArea
 )
 # 导入 Qt 核心组件和枚举值
-from PyQt6.QtCore import Qt, QTimer, QSize, pyqtSignal as Signal, QObject, QThreadPool
+from PyQt6.QtCore import Qt, QTimer, QSize, pyqtSignal as Signal, pyqtSlot as Slot, QObject, QThreadPool
 from PyQt6.QtGui import QFont, QIcon, QAction
 
 # 导入 gRPC Worker 和 proto 消息 (确保这些文件在正确的位置)
-from gRPCWorker import PromptWorker, WorkerSignals, StreamWorker
+from gRPCWorker import PromptWorker, WorkerSignals, StreamThread, STREAM_STOP_TIMEOUT_MS
+from gRPCClient import FlowRadioGRPCClient
 import proto.flowradio_pb2 as pb
 from proto import flowradio_pb2_grpc as pb_grpc # 仅在需要时
+
+# 留言区最多保留的消息条数，超出后复用最旧的 QLabel
+MAX_MESSAGES = 200
+# 消息合并刷新间隔 (毫秒)：同一窗口内到达的消息一次性插入，只触发一次布局
+MESSAGE_FLUSH_INTERVAL_MS = 16
+
 # --- 1. 主窗口类定义 ---
 class FlowRadioApp(QMainWindow):
     
     # 状态信号，用于接收实时流更新
     stream_update_signal = Signal(object) 
     
+    # 已读取的 QSS 内容 (文件路径 -> 样式字符串)，切换主题时不再重复读盘
+    _qss_cache = {}
+    
+    # 主题名 -> QSS 文件 (只读)
+    _THEMES = MappingProxyType({
+        'ios': 'qss/ios_style.qss',
+        'dark': 'qss/dark_style.qss',  # 之前的深色主题
+        'synthwave': 'qss/synthwave_style.qss', # 新的 Synthwave 主题
+        # TODO: 后续可添加 'lofi', 'ambient' 等主题
+    })
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("FlowRadio - 拟人化智能电台")
@@ -31,6 +50,18 @@ class FlowRadioApp(QMainWindow):
             'current_memory': '',       # 存储 LLM 返回的最新 memory 摘要
         }
 
+        # 待插入的消息 (text, is_user)，由 _flush_timer 批量写入留言区
+        self._pending_msgs = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(MESSAGE_FLUSH_INTERVAL_MS)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.timeout.connect(self._flush_msgs)
+        # 留言区是否停在底部：停在底部时跟随新消息滚动，用户往上翻看时不打断
+        self._follow_bottom = True
+
+        # 当前已应用的样式字符串，主题没变时不再重新 setStyleSheet
+        self._current_qss = None
+
         # 加载 QSS 样式 (假设 QSS 文件在 qss/ 目录下)
         self.switch_theme('ios')
 
@@ -53,12 +84,22 @@ class FlowRadioApp(QMainWindow):
         # 连接信号与槽
         self._connect_signals()
         
+        # 实时流消息类型 -> 处理方法，_handle_stream_update 按类型直接分发
+        self._update_handlers = {
+            pb.UpdateMessage.DJ_DECISION: self._on_dj_decision,
+            pb.UpdateMessage.VIRTUAL_COMMENT: self._on_virtual_comment,
+            pb.UpdateMessage.SYSTEM_STATUS: self._on_system_status,
+        }
+        
+        # 所有 Worker 共用一个 gRPC 客户端 (一条长连接 channel)
+        self.grpc_client = FlowRadioGRPCClient.instance()
+        
         # 初始化线程池
         self.threadpool = QThreadPool.globalInstance()
         print(f"ThreadPool 初始化，最大线程数: {self.threadpool.maxThreadCount()}")
         
-        # 启动 Stream Worker (实时监听 Go 后端推送)
-        self._start_stream_worker()
+        # 启动 Stream 线程 (实时监听 Go 后端推送)
+        self._start_stream_thread()
 
 
     # --- 2. 顶部区域：DJ & 快捷键 ---
@@ -129,6 +170,8 @@ class FlowRadioApp(QMainWindow):
         self.message_area.setWidgetResizable(True)
         
         self.message_area.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.message_area.verticalScrollBar().rangeChanged.connect(self._on_message_range_changed)
+        self.message_area.verticalScrollBar().valueChanged.connect(self._on_message_scrolled)
 
         # QScrollArea需要一个内容Widget
         self.message_content_widget = QWidget()
@@ -179,11 +222,20 @@ class FlowRadioApp(QMainWindow):
         self.btn_play_pause.clicked.connect(self._handle_play_pause)
         
         # 样式按钮点击示例
-        self.btn_style_lofi.clicked.connect(lambda: self.add_message("系统：切换至 Lo-Fi 风格"))
-        self.btn_style_lofi.clicked.connect(lambda: self.switch_theme('synthwave'))
+        self.btn_style_lofi.clicked.connect(self._on_lofi_clicked)
         # Ambient 按钮切换回 iOS 风格
-        self.btn_style_ambient.clicked.connect(lambda: self.switch_theme('ios'))
+        self.btn_style_ambient.clicked.connect(self._on_ambient_clicked)
+
+    @Slot()
+    def _on_lofi_clicked(self):
+        self.add_message("系统：切换至 Lo-Fi 风格")
+        self.switch_theme('synthwave')
 
+    @Slot()
+    def _on_ambient_clicked(self):
+        self.switch_theme('ios')
+
+    @Slot()
     def _handle_call_in(self):
         prompt_text = self.input_prompt.text().strip()
         if prompt_text:
@@ -201,7 +253,7 @@ class FlowRadioApp(QMainWindow):
             context_scene = "Coding" 
             
             # PromptWorker 现在只需发送本次输入
-            worker = PromptWorker(prompt=prompt_text, context=context_scene) 
+            worker = PromptWorker(prompt=prompt_text, context=context_scene, client=self.grpc_client) 
             
             # 连接 Worker 信号到 UI 的 Slot
             worker.signals.prompt_sent.connect(self._handle_prompt_sent)
@@ -212,67 +264,101 @@ class FlowRadioApp(QMainWindow):
             self.threadpool.start(worker)
             
     # --- 新增 Stream Worker 启动和处理逻辑 ---
-    def _start_stream_worker(self):
-        """启动后台线程，持续监听 Go 后端推送的实时更新"""
-        worker = StreamWorker()
-        
-        # 连接 Worker 的 update_received 信号到 UI 的处理槽
-        worker.signals.update_received.connect(self._handle_stream_update) 
-        worker.signals.error.connect(self._handle_worker_error)
-        
-        self.threadpool.start(worker)
+    def _start_stream_thread(self):
+        """启动专用后台线程，持续监听 Go 后端推送的实时更新"""
+        self.stream_thread = StreamThread(client=self.grpc_client)
+        
+        # 连接线程的 update_received 信号到 UI 的处理槽
+        self.stream_thread.signals.update_received.connect(self._handle_stream_update) 
+        self.stream_thread.signals.error.connect(self._handle_worker_error)
+        self.stream_thread.signals.status.connect(self._handle_stream_status)
+        self.stream_thread.signals.reconnected.connect(self._handle_stream_reconnected)
+        # 断线期间状态栏显示重连提示，这里保存断线前的状态，重连后恢复
+        self._status_before_reconnect = None
+        
+        self.stream_thread.start()
+
+    @Slot(str)
+    def _handle_stream_status(self, status_message: str):
+        """ 实时流断线重连等状态提示，只更新状态栏，不当作错误弹出 """
+        if self._status_before_reconnect is None:
+            self._status_before_reconnect = self.dj_status_label.text()
+        self.dj_status_label.setText(f"Status: 🔄 {status_message}")
 
+    @Slot()
+    def _handle_stream_reconnected(self):
+        """ 实时流重新连上后，撤掉重连提示，恢复断线前的状态 """
+        if self._status_before_reconnect is not None:
+            self.dj_status_label.setText(self._status_before_reconnect)
+            self._status_before_reconnect = None
+
+    def closeEvent(self, event):
+        """ 关闭窗口时停止 StreamThread，并等待线程退出后再销毁 (最多等待 STREAM_STOP_TIMEOUT_MS) """
+        self.stream_thread.stop()
+        if not self.stream_thread.wait(STREAM_STOP_TIMEOUT_MS):
+            print("警告：StreamThread 未能及时退出")
+        super().closeEvent(event)
+
+    @Slot(object)
     def _handle_stream_update(self, update_message: pb.UpdateMessage):
         """处理 Go 后端推送来的 UpdateMessage 实时数据"""
+        handler = self._update_handlers.get(update_message.type)
+        if handler is not None:
+            handler(update_message)
+
+    @Slot(object)
+    def _on_dj_decision(self, update_message: pb.UpdateMessage):
+        # 解析决策负载
+        decision = update_message.decision_data 
         
-        update_type = update_message.type
+        primary_prompt = decision.music_prompts[0] if decision.music_prompts else self.host_state['current_genre']
         
-        if update_type == pb.UpdateMessage.DJ_DECISION:
-            # 解析决策负载
-            decision = update_message.decision_data 
-            
-            primary_prompt = decision.music_prompts[0] if decision.music_prompts else self.host_state['current_genre']
-            
-            # 1. 更新 UI 脚本
-            self.add_message(decision.dj_script, is_user=False)
-            self.dj_status_label.setText(f"Status: 🎶 {primary_prompt} (理由: {decision.action_reason})")
-            
-            # 2. TODO: 播放音频 (使用 mpv 播放 decision.audio_data_bytes)
-            
-            # 3. 更新本地状态
-            self.host_state['current_memory'] = decision.new_conversation_memory
-            if decision.music_prompts and decision.music_prompts[0] != self.host_state['current_genre']:
-                 self.host_state['current_genre'] = decision.music_prompts[0]
-            
-            # LLM 流程完成，解锁按钮
-            self._unlock_call_in()
-
-        elif update_type == pb.UpdateMessage.VIRTUAL_COMMENT:
-            self.add_message(update_message.virtual_comment_text, is_user=False)
+        # 1. 更新 UI 脚本
+        self.add_message(decision.dj_script, is_user=False)
+        self.dj_status_label.setText(f"Status: 🎶 {primary_prompt} (理由: {decision.action_reason})")
+        
+        # 2. TODO: 播放音频 (使用 mpv 播放 decision.audio_data_bytes)
         
-        elif update_type == pb.UpdateMessage.SYSTEM_STATUS:
-            self._handle_worker_error(update_message.system_status_data.message)
+        # 3. 更新本地状态
+        self.host_state['current_memory'] = decision.new_conversation_memory
+        if decision.music_prompts and decision.music_prompts[0] != self.host_state['current_genre']:
+             self.host_state['current_genre'] = decision.music_prompts[0]
+        
+        # LLM 流程完成，解锁按钮
+        self._unlock_call_in()
+
+    @Slot(object)
+    def _on_virtual_comment(self, update_message: pb.UpdateMessage):
+        self.add_message(update_message.virtual_comment_text, is_user=False)
 
+    @Slot(object)
+    def _on_system_status(self, update_message: pb.UpdateMessage):
+        self._handle_worker_error(update_message.system_status_data.message)
+
+    @Slot(bool)
     def _handle_prompt_sent(self, success: bool):
         """ 处理 Prompt 请求发送后的 Go 后端确认信息 """
         if success:
-            # 仅显示状态，等待 StreamWorker 推送最终结果
+            # 仅显示状态，等待 StreamThread 推送最终结果
             self.dj_status_label.setText("Status: 🎧 DJ Brain 正在处理...") 
         else:
             self.dj_status_label.setText("Status: ❌ Go 后端请求失败")
             self._unlock_call_in() # 请求失败，立即解锁
 
+    @Slot(str)
     def _handle_worker_error(self, error_message: str):
-        """ 处理 gRPC 通信错误或 StreamWorker 错误 """
+        """ 处理 gRPC 通信错误或 StreamThread 错误 """
         self.add_message(f"系统错误: {error_message}", is_user=False)
         self.dj_status_label.setText("Status: ❌ 通信错误")
         self._unlock_call_in()
 
+    @Slot()
     def _unlock_call_in(self):
         """ 无论成功或失败，都在 Worker 结束后解锁按钮 """
         self.btn_call_in.setEnabled(True)
         self.btn_call_in.setText("📞 CALL IN")
         
+    @Slot()
     def _handle_play_pause(self):
         if self.btn_play_pause.text() == "⏸️":
             self.btn_play_pause.setText("▶️")
@@ -285,40 +371,85 @@ class FlowRadioApp(QMainWindow):
 
     # --- 6. 核心功能：动态添加消息 ---
     def add_message(self, text, is_user=False):
-        """动态添加一条消息到滚动区"""
-        msg_label = QLabel(text)
-        msg_label.setWordWrap(True)
-        msg_label.setObjectName("UserMessage" if is_user else "SystemMessage")
+        """动态添加一条消息到滚动区 (合并到下一次批量刷新)"""
+        self._pending_msgs.append((text, is_user))
+        # 计时器已在运行时不重启，避免持续的消息流把刷新一直往后推
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    @Slot()
+    def _flush_msgs(self):
+        """把积压的消息一次性插入留言区，并只滚动一次"""
+        # 一批超过上限时，更早的消息插入后也会立刻被复用掉，直接丢弃
+        pending = self._pending_msgs[-MAX_MESSAGES:]
+        self._pending_msgs = []
+
+        self.message_content_widget.setUpdatesEnabled(False)
+        for text, is_user in pending:
+            self._append_message_label(text, is_user)
+        self.message_content_widget.setUpdatesEnabled(True)
+
+        # 新消息要等布局刷新后 maximum() 才是最新值，所以不在这里滚动，
+        # 而是由 rangeChanged 在范围更新后滚动到底部 (仅当视图原本就在底部)
+
+    @Slot(int, int)
+    def _on_message_range_changed(self, minimum, maximum):
+        if self._follow_bottom:
+            self.message_area.verticalScrollBar().setValue(maximum)
+
+    @Slot(int)
+    def _on_message_scrolled(self, value):
+        self._follow_bottom = value >= self.message_area.verticalScrollBar().maximum()
+
+    def _append_message_label(self, text, is_user):
+        """插入一条消息的 QLabel，消息已满时复用最旧的一条"""
+        object_name = "UserMessage" if is_user else "SystemMessage"
+        if self.message_layout.count() >= MAX_MESSAGES:
+            # 消息已满：取出最旧的 QLabel 复用，布局和内存都不再增长
+            msg_label = self.message_layout.takeAt(0).widget()
+            msg_label.setText(text)
+            if msg_label.objectName() != object_name:
+                # objectName 变化后需重新 polish，QSS 样式才会更新
+                msg_label.setObjectName(object_name)
+                msg_label.style().unpolish(msg_label)
+                msg_label.style().polish(msg_label)
+        else:
+            msg_label = QLabel(text)
+            msg_label.setWordWrap(True)
+            msg_label.setObjectName(object_name)
 
         # 插入新消息
         self.message_layout.addWidget(msg_label)
-
-        # 确保滚动条自动滚动到底部
-        self.message_area.verticalScrollBar().setValue(self.message_area.verticalScrollBar().maximum())
         
     # --- 7. QSS 加载 ---
     def load_stylesheet(self, filepath):
         """从文件加载 QSS 样式"""
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                self.setStyleSheet(f.read())
-        except FileNotFoundError:
-            print(f"警告：找不到样式文件 {filepath}，将使用默认样式。")
+        qss = self._qss_cache.get(filepath)
+        if qss is None:
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    qss = f.read()
+            except FileNotFoundError:
+                print(f"警告：找不到样式文件 {filepath}，将使用默认样式。")
+                return
+            self._qss_cache[filepath] = qss
+        # setStyleSheet 会重新 polish 整棵控件树，样式未变化时直接跳过
+        if qss == self._current_qss:
+            return
+        self.setStyleSheet(qss)
+        self._current_qss = qss
     
     def switch_theme(self, theme_name):
         """动态切换 UI 主题"""
-        theme_map = {
-            'ios': 'qss/ios_style.qss',
-            'dark': 'qss/dark_style.qss',  # 之前的深色主题
-            'synthwave': 'qss/synthwave_style.qss', # 新的 Synthwave 主题
-            # TODO: 后续可添加 'lofi', 'ambient' 等主题
-        }
-        
-        filename = theme_map.get(theme_name, 'ios_style.qss') # 找不到则回退
+        filename = self._THEMES.get(theme_name, self._THEMES['ios']) # 找不到则回退到 iOS 主题
         self.load_stylesheet(filename)
 
 # --- 8. 应用启动 ---
 if __name__ == "__main__":
+    # 必须在创建 QApplication 之前设置：
+    # 不为子控件的兄弟控件创建原生窗口；合并高频事件 (鼠标移动、滚动等)
+    QApplication.setAttribute(Qt.ApplicationAttribute.AA_DontCreateNativeWidgetSiblings)
+    QApplication.setAttribute(Qt.ApplicationAttribute.AA_CompressHighFrequencyEvents)
     app = QApplication(sys.argv)
     window = FlowRadioApp()
     
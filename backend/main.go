@@ -12,6 +12,8 @@ import (
 	pb "flowradio/backend/proto" 
 
 	"google.golang.org/grpc"
+	// 注册 gzip 编码：客户端以 gzip 发起的流，服务端推送时也用 gzip 压缩
+	_ "google.golang.org/grpc/encoding/gzip"
 	// "google.golang.org/grpc/codes"
 	// "google.golang.org/grpc/status"
 )
@@ -4,6 +4,9 @@ import grpc
 import sys
 import os
 import time
+import threading
+import atexit
+import json
 
 # 导入编译后的 proto 文件
 # 修正：确保路径能找到生成的 flowradio_pb2.py 和 flowradio_pb2_grpc.py
@@ -13,12 +16,47 @@ import proto.flowradio_pb2_grpc as pb_grpc
 # 默认的 Go 后端地址和端口
 GO_BACKEND_ADDRESS = 'localhost:50051' 
 
+# HandleUserPrompt 的重试策略：仅在连接不可用 (UNAVAILABLE，如 Go 后端重启中) 时重试，最多 3 次
+# 其他错误 (含超时) 不重试，避免同一条来电被 LLM 重复处理
+SERVICE_CONFIG = {
+    'methodConfig': [{
+        'name': [{'service': 'flowradio.FlowRadioService', 'method': 'HandleUserPrompt'}],
+        'retryPolicy': {
+            'maxAttempts': 3,
+            'initialBackoff': '0.5s',
+            'maxBackoff': '2s',
+            'backoffMultiplier': 2,
+            'retryableStatusCodes': ['UNAVAILABLE'],
+        },
+    }],
+}
+
+# 共享 channel 的参数：定期 keepalive 保持连接活跃，并按 SERVICE_CONFIG 重试来电请求
+# 注意：Go 端 grpc.NewServer() 默认要求 ping 间隔不少于 5 分钟，更频繁会被服务端断开 (too_many_pings)
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 300000),
+    ('grpc.service_config', json.dumps(SERVICE_CONFIG)),
+]
+
 class FlowRadioGRPCClient:
     """
     封装 FlowRadio gRPC 服务的客户端调用
     """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """ 返回进程内共享的客户端 (首次调用时创建)，所有 Worker 复用同一条 channel """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                # 共享 channel 伴随整个进程，退出时再统一关闭
+                atexit.register(cls._instance.close)
+            return cls._instance
+
     def __init__(self, address=GO_BACKEND_ADDRESS):
-        self.channel = grpc.insecure_channel(address)
+        self.channel = grpc.insecure_channel(address, options=CHANNEL_OPTIONS)
         self.stub = pb_grpc.FlowRadioServiceStub(self.channel)
         print(f"gRPC Client initialized, connecting to {address}")
 
@@ -31,12 +69,11 @@ class FlowRadioGRPCClient:
         同步调用 Go 后端的 HandleUserPrompt RPC
         注意：多轮对话历史由 Go 后端管理，前端只需发送本次 Prompt
         """
-        # 注意：PromptRequest 结构中仍包含 conversation_history，但这里我们发送一个空列表
+        # 注意：PromptRequest 结构中仍包含 conversation_history，这里不赋值即为空列表
+        # (显式传入 [] 会额外走一遍 repeated 字段的赋值逻辑，构造耗时约翻倍)
         request = pb.PromptRequest(
             prompt_text=prompt_text,
             context_scene=context_scene,
-            # Go 后端将忽略这个空列表，但结构必须完整
-            conversation_history=[] 
         )
         try:
             response = self.stub.HandleUserPrompt(request, timeout=30) 
@@ -48,4 +85,5 @@ class FlowRadioGRPCClient:
     def stream_updates(self, client_id: str):
         """ 返回一个可迭代的流对象，用于监听实时更新 """
         request = pb.StreamRequest(client_session_id=client_id)
-        return self.stub.StreamUpdates(request)
\ No newline at end of file
+        # 推送内容多为 DJ 脚本、评论等文本，启用 gzip 压缩 (需 Go 端注册 gzip 编码)
+        return self.stub.StreamUpdates(request, compression=grpc.Compression.Gzip)
\ No newline at end of file
@@ -1,9 +1,20 @@
 # gRPCWorker.py
 
-from PyQt6.QtCore import QObject, QRunnable, pyqtSignal as Signal, QThreadPool
+from PyQt6.QtCore import QObject, QRunnable, QThread, pyqtSignal as Signal, QThreadPool
 from gRPCClient import FlowRadioGRPCClient # 导入客户端
 import proto.flowradio_pb2 as pb
 import uuid # 用于生成唯一的 Client ID
+import threading
+import grpc
+
+# 本进程的客户端会话 ID，启动时生成一次；StreamThread 重新连接时沿用同一个 ID
+CLIENT_ID = uuid.uuid4().hex
+
+# 实时流断开后的重连间隔 (秒)：从 1 秒开始指数退避，最长 30 秒
+STREAM_RETRY_INITIAL = 1
+STREAM_RETRY_MAX = 30
+# 关闭窗口时等待 StreamThread 退出的最长时间 (毫秒)
+STREAM_STOP_TIMEOUT_MS = 2000
 
 # =========================================================================
 # 信号类
@@ -13,24 +24,25 @@ class WorkerSignals(QObject):
     error = Signal(str)                 
     prompt_sent = Signal(bool)          
     update_received = Signal(object)    # 新增：接收 UpdateMessage 对象的信号
+    status = Signal(str)                # 连接状态提示 (如断线重连中)，不算错误
+    reconnected = Signal()              # 断线后重新连上 Go 后端
 
 # =========================================================================
 # 1. PromptWorker (同步调用 HandleUserPrompt)
 # =========================================================================
 class PromptWorker(QRunnable):
-    def __init__(self, prompt: str, context: str):
+    def __init__(self, prompt: str, context: str, client: FlowRadioGRPCClient = None):
         super().__init__()
         self.prompt = prompt
         self.context = context
+        # 复用 UI 传入的共享客户端，避免每次来电都重新建立 channel
+        self.client = client or FlowRadioGRPCClient.instance()
         self.signals = WorkerSignals()
         
     def run(self):
-        client = None
         try:
-            client = FlowRadioGRPCClient()
-            
             # 调用 gRPC (同步阻塞)
-            response = client.handle_user_prompt(self.prompt, self.context)
+            response = self.client.handle_user_prompt(self.prompt, self.context)
             
             self.signals.prompt_sent.emit(response.success)
             
@@ -41,40 +53,85 @@ class PromptWorker(QRunnable):
             self.signals.error.emit(f"gRPC 通信失败: {e}")
             
         finally:
-            if client:
-                client.close()
+            # 共享 channel 不在这里关闭
             self.signals.finished.emit()
 
 
 # =========================================================================
-# 2. StreamWorker (异步持续监听 StreamUpdates)
+# 2. StreamThread (专用线程，持续监听 StreamUpdates)
 # =========================================================================
-class StreamWorker(QRunnable):
-    def __init__(self):
-        super().__init__()
+class StreamThread(QThread):
+    """
+    实时流在整个程序生命周期内一直阻塞，因此使用独立的 QThread，
+    不长期占用 QThreadPool 的槽位 (线程池留给 PromptWorker 这类短任务)
+    """
+    def __init__(self, client: FlowRadioGRPCClient = None, parent=None):
+        super().__init__(parent)
+        self.client = client or FlowRadioGRPCClient.instance()
         self.signals = WorkerSignals()
-        self.client_id = str(uuid.uuid4())
+        self.client_id = CLIENT_ID
+        # 用于打断重连前的等待
+        self._wake = threading.Event()
+        # 保护 _call：stop() 在 UI 线程读取，run() 在本线程赋值
+        self._call_lock = threading.Lock()
+        self._call = None
+        # 断线后置为 True，重新连上时发出 reconnected 并清除
+        self._reconnecting = False
+
+    def stop(self):
+        """ 停止监听：请求中断、取消当前流并打断重连等待 (UI 关闭时调用) """
+        self.requestInterruption()
+        self._wake.set()
+        with self._call_lock:
+            if self._call is not None:
+                self._call.cancel()
+
+    def _on_connectivity_change(self, state):
+        """ channel 状态回调 (在 gRPC 内部线程调用)：断线后重新 READY 即视为已重连 """
+        if state == grpc.ChannelConnectivity.READY:
+            self._mark_reconnected()
+
+    def _mark_reconnected(self):
+        if self._reconnecting:
+            self._reconnecting = False
+            self.signals.reconnected.emit()
         
     def run(self):
-        client = None
+        print(f"StreamThread started. Client ID: {self.client_id}")
+        backoff = STREAM_RETRY_INITIAL
+        self.client.channel.subscribe(self._on_connectivity_change)
         try:
-            client = FlowRadioGRPCClient()
-            stream_iterator = client.stream_updates(self.client_id)
-            
-            print(f"StreamWorker started. Client ID: {self.client_id}")
+            while not self.isInterruptionRequested():
+                try:
+                    call = self.client.stream_updates(self.client_id)
+                    with self._call_lock:
+                        self._call = call
+                    # stop() 可能发生在上面的循环判断之后、赋值之前，此时它看不到这个新的流
+                    if self.isInterruptionRequested():
+                        call.cancel()
 
-            # 持续监听流
-            for update_message in stream_iterator:
-                # 将接收到的 proto 消息对象通过信号发送给 UI 主线程
-                self.signals.update_received.emit(update_message)
-            
-            # 如果流断开，则循环结束
-            self.signals.error.emit("实时流断开连接，请检查 Go 后端。")
+                    # 持续监听流
+                    for update_message in call:
+                        backoff = STREAM_RETRY_INITIAL
+                        # channel 一直 READY 时 (仅流被服务端结束) 没有状态回调，收到消息即确认已重连
+                        self._mark_reconnected()
+                        # 将接收到的 proto 消息对象通过信号发送给 UI 主线程
+                        self.signals.update_received.emit(update_message)
+                except grpc.RpcError:
+                    pass
+
+                if self.isInterruptionRequested():
+                    break
+
+                # 流断开：在同一个线程、同一条 channel 上等待后重连
+                self._reconnecting = True
+                self.signals.status.emit(f"实时流断开，{backoff} 秒后重新连接...")
+                self._wake.wait(backoff)
+                backoff = min(STREAM_RETRY_MAX, backoff * 2)
 
         except Exception as e:
             self.signals.error.emit(f"实时流监听失败: {e}")
             
         finally:
-            if client:
-                client.close()
+            self.client.channel.unsubscribe(self._on_connectivity_change)
             self.signals.finished.emit()
\ No newline at end of file